@@ -0,0 +1,116 @@
+"""
+Micro-benchmark for the CSV importer's row normalization
+Compares the single-pass parse_ipv4 against the previous
+is_valid_ip / calculate_subnet_from_ip / ip_to_int chain on a synthetic
+datalake export (1M rows by default)
+"""
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+import import_csv_data
+
+CSV_FIELDS = ('ifIP', 'host_name', 'ifName', 'ifDescr', 'domain', 'vendor', 'model', 'ifAdminStatus', 'ifOperStatus')
+
+def legacy_parse_ipv4(ip_str):
+    """The importer's address handling before parse_ipv4 (three parses per row), same return shape"""
+    if not ip_str or ip_str == '-' or not import_csv_data.is_valid_ip(ip_str):
+        return None
+    if ip_str.startswith('127.'):
+        return None
+    subnet = import_csv_data.calculate_subnet_from_ip(ip_str)
+    if not subnet:
+        return None
+    return import_csv_data.ip_to_int(ip_str), ip_str, subnet
+
+def write_synthetic_csv(path, rows, seed=42):
+    """Datalake-shaped CSV: addresses clustered in a few thousand /24s, ~5% missing or invalid"""
+    rng = random.Random(seed)
+    networks = [(rng.choice((10, 100, 172, 192)), rng.randrange(256), rng.randrange(256)) for _ in range(4000)]
+    domains = ('IPRAN-D', 'RN/AGN', 'IPCORE-BB', 'IPCORE-MB', 'CGNAT-PROD', 'MGMT-CORE', 'DMZ-ACCESS')
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_FIELDS)
+        for i in range(rows):
+            roll = rng.random()
+            if roll < 0.03:
+                ip_address = '-'
+            elif roll < 0.05:
+                ip_address = f"{rng.randrange(300)}.{rng.randrange(256)}.{rng.randrange(256)}"
+            else:
+                a, b, c = rng.choice(networks)
+                ip_address = f"{a}.{b}.{c}.{rng.randrange(1, 255)}"
+            writer.writerow((
+                ip_address, f"node-{i % 50000:05d}", f"GigabitEthernet0/{i % 48}", f"uplink {i % 7}",
+                rng.choice(domains), 'Huawei', 'NE40E', 'Up', rng.choice(('Up', 'Up', 'Down'))
+            ))
+
+def timed(label, rows, func):
+    """Run func once and print/return its rows/sec"""
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    rate = rows / max(elapsed, 1e-9)
+    print(f"   {label:<28} {elapsed:7.2f}s  {rate:>12,.0f} rows/sec")
+    return rate
+
+def bench_addresses(addresses):
+    """Address parsing alone, old chain vs parse_ipv4"""
+    print("🔬 Address parsing + subnet derivation")
+    before = timed("before (3 parses)", len(addresses), lambda: [legacy_parse_ipv4(ip) for ip in addresses])
+    import_csv_data.subnet_24.cache_clear()
+    after = timed("after (parse_ipv4)", len(addresses), lambda: [import_csv_data.parse_ipv4(ip) for ip in addresses])
+    print(f"   speedup: {after / before:.2f}x")
+
+def bench_rows(csv_path, rows):
+    """Full normalize_csv_row over csv.DictReader, with the old and new address path"""
+    def normalize_all():
+        with open(csv_path, newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                import_csv_data.normalize_csv_row(row)
+
+    print("🔬 CSV read + normalize_csv_row (end to end)")
+    fast_parse = import_csv_data.parse_ipv4
+    import_csv_data.parse_ipv4 = legacy_parse_ipv4
+    try:
+        before = timed("before (3 parses)", rows, normalize_all)
+    finally:
+        import_csv_data.parse_ipv4 = fast_parse
+    import_csv_data.subnet_24.cache_clear()
+    after = timed("after (parse_ipv4)", rows, normalize_all)
+    print(f"   speedup: {after / before:.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark importer row normalization before/after the single-pass IPv4 parser")
+    parser.add_argument('--rows', type=int, default=1000000, help="Synthetic rows to generate")
+    parser.add_argument('--csv', help="Benchmark an existing datalake CSV instead of a synthetic one")
+    args = parser.parse_args(argv)
+
+    csv_path = args.csv
+    temp_path = None
+    try:
+        if not csv_path:
+            handle, temp_path = tempfile.mkstemp(suffix='.csv')
+            os.close(handle)
+            print(f"🧪 Writing {args.rows:,} synthetic rows to {temp_path}")
+            write_synthetic_csv(temp_path, args.rows)
+            csv_path = temp_path
+
+        with open(csv_path, newline='', encoding='utf-8') as file:
+            addresses = [(row.get('ifIP') or '').strip() for row in csv.DictReader(file)]
+        print(f"📊 {len(addresses):,} rows")
+        print("=" * 80)
+        bench_addresses(addresses)
+        bench_rows(csv_path, len(addresses))
+        cache = import_csv_data.subnet_24.cache_info()
+        print(f"🗂️ /24 subnet memo: {cache.hits:,} hits, {cache.misses:,} misses")
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+if __name__ == '__main__':
+    main()
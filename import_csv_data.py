@@ -5,10 +5,25 @@ Parse network inventory CSV and populate ip_inventory table
 
 import mysql.connector
 from mysql.connector import Error
+import argparse
+import bz2
 import csv
+import gzip
+import hashlib
+import io
+import itertools
 import ipaddress
+import json
+import lzma
+import os
 import re
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
 # Database Configuration
 DB_CONFIG = {
@@ -18,44 +33,117 @@ DB_CONFIG = {
     'database': 'ipam_db'
 }
 
-def get_db_connection():
+def get_db_connection(**options):
     """Get database connection"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = mysql.connector.connect(**DB_CONFIG, **options)
         return connection
     except Error as e:
         print(f"❌ Database connection error: {e}")
         return None
 
+# Used when no vrf_mapping.json is found (substring of the upper-cased domain -> VRF)
+DEFAULT_VRF_MAPPING = {
+    'CGNAT': 'cgnat',
+    'MGMT': 'management',
+    'PROD': 'production',
+    'DEV': 'development',
+    'TEST': 'testing',
+    'GUEST': 'guest',
+    'DMZ': 'dmz',
+    'CORE': 'core',
+    'ACCESS': 'access'
+}
+VRF_MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vrf_mapping.json')
+VRF_MEMO_SIZE = 4096
+
+# Pseudo rule names for domains no rule matched
+VRF_RULE_EMPTY = '(empty domain)'
+VRF_RULE_NONE = '(no rule - domain used as-is)'
+
+class VrfClassifier:
+    """Map a domain to its VRF with the first mapping rule (in file order) found in it
+    
+    All rules are compiled into one regex of lookaheads, so a single scan
+    finds every rule occurring at every position; the lowest rule index
+    wins, matching the old loop over the dict. Results are memoized by raw
+    domain (there are only a few hundred distinct ones), and hit counts per
+    rule are tallied on every call, cached or not.
+    """
+    
+    def __init__(self, mapping, memo_size=VRF_MEMO_SIZE):
+        # Domains are matched upper-cased, so keys are too (first spelling wins)
+        self.rules = []
+        for key, vrf in mapping.items():
+            if key and key.upper() not in (rule for rule, _ in self.rules):
+                self.rules.append((key.upper(), vrf))
+        alternation = '|'.join(f'(?P<r{index}>{re.escape(key)})' for index, (key, _) in enumerate(self.rules))
+        self.pattern = re.compile(f'(?=(?:{alternation}))') if self.rules else None
+        self.hits = {}
+        self._classify = lru_cache(maxsize=memo_size)(self._classify)
+    
+    def _classify(self, domain):
+        """(vrf, rule name) for a raw domain"""
+        if not domain:
+            return 'default', VRF_RULE_EMPTY
+        if self.pattern:
+            # At one position the alternation stops at the lowest matching index,
+            # so the minimum over all positions is the first rule in the mapping
+            indexes = [int(match.lastgroup[1:]) for match in self.pattern.finditer(domain.upper())]
+            if indexes:
+                key, vrf = self.rules[min(indexes)]
+                return vrf, key
+        return domain.lower(), VRF_RULE_NONE
+    
+    def __call__(self, domain):
+        vrf, rule = self._classify(domain)
+        self.hits[rule] = self.hits.get(rule, 0) + 1
+        return vrf
+    
+    def take_hits(self):
+        """Return and reset the per-rule hit counts"""
+        hits, self.hits = self.hits, {}
+        return hits
+    
+    def add_hits(self, hits):
+        for rule, count in hits.items():
+            self.hits[rule] = self.hits.get(rule, 0) + count
+
+def load_vrf_mapping(path=None):
+    """Rule mapping from path, $IPAM_VRF_MAPPING or vrf_mapping.json next to this script (else the built-in default)"""
+    path = path or os.environ.get('IPAM_VRF_MAPPING')
+    if not path:
+        if not os.path.exists(VRF_MAPPING_FILE):
+            return dict(DEFAULT_VRF_MAPPING)
+        path = VRF_MAPPING_FILE
+    with open(path, 'r', encoding='utf-8') as file:
+        mapping = json.load(file)
+    if not isinstance(mapping, dict) or not all(isinstance(value, str) for value in mapping.values()):
+        raise ValueError(f"{path} must be a JSON object of domain substring -> VRF name")
+    return mapping
+
+vrf_classifier = VrfClassifier(DEFAULT_VRF_MAPPING)
+
+def set_vrf_mapping(mapping):
+    """Replace the classifier (also the process pool initializer, so workers use the same rules)"""
+    global vrf_classifier
+    vrf_classifier = VrfClassifier(mapping)
+
 def extract_vrf_from_domain(domain):
     """Extract VRF/VPN information from domain field"""
-    if not domain:
-        return 'default'
-    
-    # Common VRF patterns
-    vrf_mapping = {
-        'CGNAT': 'cgnat',
-        'MGMT': 'management', 
-        'mgmt': 'management',
-        'PROD': 'production',
-        'prod': 'production',
-        'DEV': 'development',
-        'dev': 'development',
-        'TEST': 'testing',
-        'test': 'testing',
-        'GUEST': 'guest',
-        'guest': 'guest',
-        'DMZ': 'dmz',
-        'CORE': 'core',
-        'ACCESS': 'access'
-    }
-    
-    domain_upper = domain.upper()
-    for key, vrf in vrf_mapping.items():
-        if key in domain_upper:
-            return vrf
-    
-    return domain.lower()
+    return vrf_classifier(domain)
+
+def report_vrf_hits():
+    """Print how many rows each VRF rule classified during this run"""
+    hits = vrf_classifier.hits
+    if not hits:
+        return
+    print("🏷️ VRF rule hits:")
+    rules = [key for key, _ in vrf_classifier.rules] + [VRF_RULE_EMPTY, VRF_RULE_NONE]
+    for rule in rules:
+        print(f"   - {rule:30} {hits.get(rule, 0):>12,}")
+    cache = vrf_classifier._classify.cache_info()
+    print(f"   Memo: {cache.currsize:,} domains cached, {cache.hits:,} hits, {cache.misses:,} misses")
 
 def calculate_subnet_from_ip(ip_str):
     """Calculate subnet based on IP address (assume /24 for most cases)"""
@@ -78,6 +166,10 @@ def calculate_subnet_from_ip(ip_str):
     except:
         return None
 
+def ip_to_int(ip_str):
+    """Convert IP address string to its integer value (ip_int column)"""
+    return int(ipaddress.ip_address(ip_str))
+
 def is_valid_ip(ip_str):
     """Check if string is valid IP address"""
     try:
@@ -86,8 +178,475 @@ def is_valid_ip(ip_str):
     except:
         return False
 
-def import_csv_data(csv_file_path, limit=None):
-    """Import data from CSV file to database"""
+@lru_cache(maxsize=65536)
+def subnet_24(network):
+    """'a.b.c.0/24' for the top 24 bits of an address (memoized - rows cluster in few /24s)"""
+    return f"{network >> 16}.{(network >> 8) & 0xFF}.{network & 0xFF}.0/24"
+
+def parse_ipv4(ip_str):
+    """Parse dotted-quad IPv4 in one pass - (address int, canonical string, /24 subnet) or None
+    
+    Accepts exactly what ipaddress.IPv4Address does (four ASCII decimal
+    octets, no leading zeros), so valid input is already canonical; the
+    importer's is_valid_ip / calculate_subnet_from_ip / ip_to_int chain
+    parsed each address three times.
+    """
+    parts = ip_str.split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        if not (0 < len(part) <= 3 and part.isascii() and part.isdigit()) or (part[0] == '0' and len(part) > 1):
+            return None
+        octet = int(part)
+        if octet > 255:
+            return None
+        value = (value << 8) | octet
+    return value, ip_str, subnet_24(value >> 8)
+
+def bump_shared_generation(cursor):
+    """Tell running servers the data changed (they poll ipam_meta and drop their caches)"""
+    cursor.execute("""
+        INSERT INTO ipam_meta (name, value) VALUES ('data_generation', 1)
+        ON DUPLICATE KEY UPDATE value = value + 1
+    """)
+
+def ensure_import_tables(cursor):
+    """Create the bookkeeping tables the importer writes to (normally created by main_server.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ipam_meta (
+            name VARCHAR(64) PRIMARY KEY,
+            value BIGINT UNSIGNED NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ip_change_log (
+            seq BIGINT UNSIGNED PRIMARY KEY,
+            op ENUM('insert', 'update', 'delete', 'reset') NOT NULL,
+            ip_address VARCHAR(15),
+            old_ip_address VARCHAR(15),
+            row_data JSON,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_change_time (changed_at)
+        )
+    """)
+    # Delta mode compares against this; older servers may not have added it yet
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ip_inventory' AND COLUMN_NAME = 'content_hash'
+    """)
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("ALTER TABLE ip_inventory ADD COLUMN content_hash BIGINT UNSIGNED NULL")
+        print("🔧 Added column ip_inventory.content_hash")
+    # One row per input file while a batch import is in progress (see --resume)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            file_path VARCHAR(512) PRIMARY KEY,
+            file_size BIGINT UNSIGNED NOT NULL,
+            file_mtime DOUBLE NOT NULL,
+            head_hash CHAR(32) NOT NULL,
+            byte_offset BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            rows_processed BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            rows_committed BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+def log_import_reset(cursor):
+    """Add a 'reset' entry to the change feed - consumers resync after a full import"""
+    cursor.execute("""
+        INSERT INTO ipam_meta (name, value) VALUES ('change_seq', LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE value = LAST_INSERT_ID(value + 1)
+    """)
+    cursor.execute(
+        "INSERT INTO ip_change_log (seq, op) VALUES (%s, 'reset')",
+        (cursor.lastrowid,)
+    )
+
+STDIN_PATH = '-'
+READ_BUFFER_BYTES = 1024 * 1024
+
+# Leading bytes of each supported compressed format and the module that streams it
+COMPRESSION_FORMATS = (
+    (b'\x1f\x8b', gzip),
+    (b'BZh', bz2),
+    (b'\xfd7zXZ\x00', lzma),
+)
+
+def detect_compression(head):
+    """Module for decompressing a stream starting with head (gzip/bz2/lzma), or None for plain CSV"""
+    for magic, module in COMPRESSION_FORMATS:
+        if head.startswith(magic):
+            return module
+    return None
+
+def open_csv_input(csv_file_path):
+    """Binary stream of CSV bytes from a path or '-' (stdin), decompressed on the fly if needed
+    
+    The format is taken from the magic bytes, not the file name. Reads go
+    through fixed-size buffers, so memory does not grow with the input.
+    """
+    if csv_file_path == STDIN_PATH:
+        stream = sys.stdin.buffer
+        module = detect_compression(stream.peek(8)[:8])
+        return module.open(stream, 'rb') if module else stream
+    with open(csv_file_path, 'rb') as file:
+        module = detect_compression(file.read(8))
+    if module:
+        return module.open(csv_file_path, 'rb')
+    return open(csv_file_path, 'rb', buffering=READ_BUFFER_BYTES)
+
+def is_plain_file(csv_file_path):
+    """True for an uncompressed file on disk - the only input that can be split into byte ranges"""
+    if csv_file_path == STDIN_PATH:
+        return False
+    with open(csv_file_path, 'rb') as file:
+        return detect_compression(file.read(8)) is None
+
+CHECKPOINT_IDENTITY_FIELDS = ('file_size', 'file_mtime', 'head_hash')
+
+def file_identity(csv_file_path):
+    """Identify an input file by path, size, mtime and a hash of its first 1 MB"""
+    path = os.path.abspath(csv_file_path)
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        head_hash = hashlib.blake2b(file.read(1024 * 1024), digest_size=16).hexdigest()
+    return {'file_path': path, 'file_size': stat.st_size, 'file_mtime': stat.st_mtime, 'head_hash': head_hash}
+
+def load_checkpoint(cursor, identity):
+    """The saved checkpoint for this file, or None - raises ValueError if the file changed since it was written"""
+    cursor.execute("""
+        SELECT file_size, file_mtime, head_hash, byte_offset, rows_processed, rows_committed
+        FROM import_checkpoints WHERE file_path = %s
+    """, (identity['file_path'],))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    checkpoint = dict(zip(CHECKPOINT_IDENTITY_FIELDS + ('byte_offset', 'rows_processed', 'rows_committed'), row))
+    if any(checkpoint[field] != identity[field] for field in CHECKPOINT_IDENTITY_FIELDS):
+        raise ValueError(f"{identity['file_path']} changed since the interrupted import - run it again without --resume")
+    checkpoint['file_path'] = identity['file_path']
+    return checkpoint
+
+def save_checkpoint(cursor, checkpoint):
+    """Upsert the checkpoint row (caller commits it together with the rows it covers)"""
+    cursor.execute("""
+        INSERT INTO import_checkpoints
+            (file_path, file_size, file_mtime, head_hash, byte_offset, rows_processed, rows_committed)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        file_size = VALUES(file_size),
+        file_mtime = VALUES(file_mtime),
+        head_hash = VALUES(head_hash),
+        byte_offset = VALUES(byte_offset),
+        rows_processed = VALUES(rows_processed),
+        rows_committed = VALUES(rows_committed)
+    """, tuple(checkpoint[field] for field in (
+        'file_path', 'file_size', 'file_mtime', 'head_hash', 'byte_offset', 'rows_processed', 'rows_committed'
+    )))
+
+# ip_inventory columns written by the importer (in INSERT order)
+IMPORT_COLUMNS = ('ip_address', 'subnet', 'status', 'vrf_vpn', 'hostname', 'description', 'ip_int', 'content_hash')
+
+DEFAULT_BATCH_SIZE = 1000
+
+def normalize_csv_row(row):
+    """Turn one datalake CSV row into an ip_inventory tuple (IMPORT_COLUMNS order), or None to skip it"""
+    # Extract data from CSV row
+    ip_address = (row.get('ifIP') or '').strip()
+    host_name = (row.get('host_name') or '').strip()
+    if_name = (row.get('ifName') or '').strip()
+    if_descr = (row.get('ifDescr') or '').strip()
+    domain = (row.get('domain') or '').strip()
+    vendor = (row.get('vendor') or '').strip()
+    model = (row.get('model') or '').strip()
+    admin_status = (row.get('ifAdminStatus') or '').strip()
+    oper_status = (row.get('ifOperStatus') or '').strip()
+    
+    # Skip if no IP address or invalid IP
+    parsed = parse_ipv4(ip_address)
+    if parsed is None:
+        return None
+    ip_int, ip_address, subnet = parsed
+    
+    # Skip loopback IPs (127.0.0.0/8)
+    if ip_int >> 24 == 127:
+        return None
+    
+    # Extract VRF from domain
+    vrf_vpn = extract_vrf_from_domain(domain)
+    
+    # Determine status based on admin and operational status
+    if admin_status == 'Up' and oper_status == 'Up':
+        status = 'used'
+    elif admin_status == 'Up' and oper_status == 'Down':
+        status = 'reserved'
+    else:
+        status = 'available'
+    
+    # Create description
+    description_parts = []
+    if if_name:
+        description_parts.append(f"Interface: {if_name}")
+    if if_descr and if_descr != if_name:
+        description_parts.append(f"Desc: {if_descr}")
+    if vendor:
+        description_parts.append(f"Vendor: {vendor}")
+    if model:
+        description_parts.append(f"Model: {model}")
+    
+    description = " | ".join(description_parts) if description_parts else f"Imported from CSV - {host_name}"
+    
+    # Create hostname
+    hostname = host_name if host_name else f"host-{ip_address.replace('.', '-')}"
+    
+    values = (ip_address, subnet, status, vrf_vpn, hostname, description)
+    return values + (ip_int, row_fingerprint(values))
+
+def row_fingerprint(values):
+    """64-bit hash of a row's imported text fields (stored as ip_inventory.content_hash)"""
+    digest = hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def upsert_sql(row_count):
+    """Multi-row INSERT ... ON DUPLICATE KEY UPDATE for row_count rows"""
+    placeholders = "(" + ", ".join(["%s"] * len(IMPORT_COLUMNS)) + ")"
+    return f"""
+        INSERT INTO ip_inventory ({', '.join(IMPORT_COLUMNS)})
+        VALUES {', '.join([placeholders] * row_count)}
+        ON DUPLICATE KEY UPDATE
+        status = VALUES(status),
+        vrf_vpn = VALUES(vrf_vpn),
+        hostname = VALUES(hostname),
+        description = VALUES(description),
+        ip_int = VALUES(ip_int),
+        content_hash = VALUES(content_hash),
+        updated_at = CURRENT_TIMESTAMP
+    """
+
+def upsert_counter_deltas(old_rows, rows):
+    """ip_subnet_counters deltas for upserting rows over old_rows ({ip_int: row dict})
+    
+    The last occurrence of an address wins, as in the upsert; an existing
+    row keeps its subnet (ON DUPLICATE KEY UPDATE does not change it).
+    """
+    deltas = {}
+    for ip_int, values in {values[6]: values for values in rows}.items():
+        old_row = old_rows.get(ip_int)
+        new_key = (old_row['subnet'] if old_row else values[1], values[3] or '', values[2])
+        old_key = (old_row['subnet'], old_row['vrf_vpn'] or '', old_row['status']) if old_row else None
+        for key, delta in ((old_key, -1), (new_key, 1)):
+            if key and key[2]:
+                deltas[key] = deltas.get(key, 0) + delta
+    return deltas
+
+def write_batch(connection, cursor, rows, checkpoint=None, **progress):
+    """Upsert a batch with one statement and commit it - returns (inserted, skipped)
+    
+    If the statement fails the batch is retried row by row so one bad row
+    only skips itself. The subnet counters are adjusted and a checkpoint
+    dict is saved in the same transaction - the checkpoint advanced by
+    progress (byte_offset/rows_processed at the end of this batch) and the
+    rows committed, and updated in place once committed.
+    """
+    if not rows and not checkpoint:
+        return 0, 0
+    try:
+        if rows:
+            old_rows = fetch_rows_by_ip_int(cursor, [row[6] for row in rows], lock=True)
+            cursor.execute(upsert_sql(len(rows)), [value for row in rows for value in row])
+            apply_counter_deltas(cursor, upsert_counter_deltas(old_rows, rows))
+        if checkpoint:
+            saved = dict(checkpoint, **progress, rows_committed=checkpoint['rows_committed'] + len(rows))
+            save_checkpoint(cursor, saved)
+        connection.commit()
+        if checkpoint:
+            checkpoint.update(saved)
+        return len(rows), 0
+    except Error as e:
+        connection.rollback()
+        print(f"⚠️ Batch of {len(rows):,} rows failed ({e}), retrying row by row")
+    
+    written = []
+    old_rows = fetch_rows_by_ip_int(cursor, [row[6] for row in rows], lock=True)
+    for row in rows:
+        try:
+            cursor.execute(upsert_sql(1), row)
+            written.append(row)
+        except Error as e:
+            if "Duplicate entry" not in str(e):
+                print(f"⚠️ Error inserting {row[0]}: {e}")
+    apply_counter_deltas(cursor, upsert_counter_deltas(old_rows, written))
+    inserted = len(written)
+    skipped = len(rows) - inserted
+    if checkpoint:
+        saved = dict(checkpoint, **progress, rows_committed=checkpoint['rows_committed'] + inserted)
+        save_checkpoint(cursor, saved)
+    connection.commit()
+    if checkpoint:
+        checkpoint.update(saved)
+    return inserted, skipped
+
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+
+def csv_chunks(csv_file_path, chunk_bytes=PARALLEL_CHUNK_BYTES, start_offset=0):
+    """Header field names and (start, end) byte ranges covering the CSV body (from start_offset, if later)
+    
+    A range owns every line that starts inside it, so ranges need not fall
+    on line boundaries. Only valid while every record is one line - workers
+    raise MultilineRecordError otherwise.
+    """
+    with open(csv_file_path, 'rb') as file:
+        header = file.readline()
+        body_start = max(file.tell(), start_offset)
+        file_size = os.fstat(file.fileno()).st_size
+    fieldnames = next(csv.reader([header.decode('utf-8')]))
+    chunks = [(start, min(start + chunk_bytes, file_size)) for start in range(body_start, file_size, chunk_bytes)]
+    return fieldnames, chunks
+
+class MultilineRecordError(ValueError):
+    """A chunk holds a quoted field spanning lines, so byte ranges are not record boundaries"""
+
+def normalize_chunk(csv_file_path, fieldnames, start, end):
+    """Worker: normalize the lines starting in [start, end)
+    
+    Returns ([(values or None, end offset) per record, in order], VRF rule hits for the chunk).
+    A line with an odd number of quote characters opens or closes a quoted
+    field across a line break; the chunk then raises MultilineRecordError.
+    """
+    lines = []
+    with open(csv_file_path, 'rb') as file:
+        # Back up one byte so a range starting exactly at a line start keeps that line
+        file.seek(start - 1)
+        file.readline()
+        base = position = file.tell()
+        while position < end:
+            line = file.readline()
+            if not line:
+                break
+            if line.count(b'"') % 2:
+                raise MultilineRecordError(f"record spanning lines near byte {position:,}")
+            position += len(line)
+            lines.append(line)
+    # Offsets per record as the serial reader reports them (blank lines yield no record)
+    reader = OffsetLineReader(io.BytesIO(b''.join(lines)))
+    results = [(normalize_csv_row(row), base + reader.offset) for row in csv.DictReader(reader, fieldnames=fieldnames)]
+    return results, vrf_classifier.take_hits()
+
+def parallel_normalized_chunks(csv_file_path, workers, start_offset=0):
+    """Yield per-chunk results from a process pool, in file order (output does not depend on worker count)
+    
+    If a chunk turns out to contain a record spanning lines, the rest of the
+    file - from the end of the last record already yielded - is parsed
+    serially instead, so rows and offsets still match the serial path.
+    """
+    fieldnames, chunks = csv_chunks(csv_file_path, start_offset=start_offset)
+    mapping = {key: vrf for key, vrf in vrf_classifier.rules}
+    last_offset = start_offset
+    fallback = False
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_vrf_mapping, initargs=(mapping,)) as pool:
+        pending = deque()
+        chunk_iter = iter(chunks)
+        # Keep a bounded number of chunks in flight so memory stays flat if the writer is slower
+        for start, end in itertools.islice(chunk_iter, workers * 2):
+            pending.append(pool.submit(normalize_chunk, csv_file_path, fieldnames, start, end))
+        while pending:
+            try:
+                results, hits = pending.popleft().result()
+            except MultilineRecordError:
+                for future in pending:
+                    future.cancel()
+                fallback = True
+                break
+            vrf_classifier.add_hits(hits)
+            for start, end in itertools.islice(chunk_iter, 1):
+                pending.append(pool.submit(normalize_chunk, csv_file_path, fieldnames, start, end))
+            if results:
+                last_offset = results[-1][1]
+            yield results
+    if fallback:
+        print("💡 The CSV has records spanning several lines - parsing the rest in one process")
+        yield serial_normalized_rows(csv_file_path, last_offset)
+
+class OffsetLineReader:
+    """Decoded lines of a binary file, tracking the byte offset just past the last line returned
+    
+    csv.reader pulls lines on demand, so after it returns a record offset is
+    where that record ends - even for records with quoted newlines.
+    """
+    
+    def __init__(self, file, encoding='utf-8'):
+        self.file = file
+        self.encoding = encoding
+        self.offset = 0  # file is freshly opened (pipes cannot tell())
+    
+    def seek(self, offset):
+        # Compressed streams emulate this by decompressing up to offset
+        self.file.seek(offset)
+        self.offset = offset
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+def serial_normalized_rows(csv_file_path, start_offset=0):
+    """(values or None, end offset) per record, starting at start_offset if it is past the header
+    
+    Offsets count decompressed bytes for compressed input.
+    """
+    with open_csv_input(csv_file_path) as file:
+        lines = OffsetLineReader(file)
+        fieldnames = next(csv.reader(lines))
+        if start_offset > lines.offset:
+            lines.seek(start_offset)
+        for row in csv.DictReader(lines, fieldnames=fieldnames):
+            yield normalize_csv_row(row), lines.offset
+
+def normalized_rows(csv_file_path, limit, counts, workers=1, start_offset=0):
+    """Yield normalized ip_inventory tuples from a CSV file, tallying processed/skipped rows in counts
+    
+    counts['offset'] is kept at the byte offset just past the last processed
+    record, so while a row is being handled it marks where the next read
+    would resume. With workers > 1 parsing and normalization run in a
+    process pool (plain files only); rows still come out in file order.
+    """
+    if workers > 1 and not is_plain_file(csv_file_path):
+        print("💡 Compressed or piped input is read sequentially - ignoring --workers")
+        workers = 1
+    if workers > 1:
+        results = (result for chunk in parallel_normalized_chunks(csv_file_path, workers, start_offset) for result in chunk)
+    else:
+        results = serial_normalized_rows(csv_file_path, start_offset)
+    
+    for values, offset in results:
+        # Apply limit if specified
+        if limit and counts['processed'] >= limit:
+            break
+        counts['processed'] += 1
+        counts['offset'] = offset
+        
+        if values is None:
+            counts['skipped'] += 1
+            continue
+        yield values
+
+
+def import_csv_data(csv_file_path, limit=None, batch_size=DEFAULT_BATCH_SIZE, workers=1, resume=False):
+    """Import data from CSV file to database (batch_size rows per INSERT and commit)
+    
+    Each batch commits together with a checkpoint row (file identity, byte
+    offset past the batch, rows processed/committed). With resume=True the
+    table is not cleared and reading continues from that offset, so an
+    interrupted import neither repeats nor skips rows. Input read from
+    stdin has no identity, so it is not checkpointed.
+    """
+    checkpoint = None
     try:
         connection = get_db_connection()
         if not connection:
@@ -95,136 +654,429 @@ def import_csv_data(csv_file_path, limit=None):
             return
         
         cursor = connection.cursor()
+        ensure_import_tables(cursor)
+        identity = file_identity(csv_file_path) if csv_file_path != STDIN_PATH else None
         
-        # Clear existing data
-        print("🗑️ Clearing existing data...")
-        cursor.execute("DELETE FROM ip_inventory")
+        if resume:
+            checkpoint = load_checkpoint(cursor, identity)
+            if checkpoint is None:
+                print(f"❌ No checkpoint for {identity['file_path']} - run the import without --resume")
+                return 0
+            print(f"⏩ Resuming at byte {checkpoint['byte_offset']:,} ({checkpoint['rows_processed']:,} records processed, {checkpoint['rows_committed']:,} imported)")
+        else:
+            # Clear existing data (and the per-subnet counters derived from it)
+            print("🗑️ Clearing existing data...")
+            cursor.execute("DELETE FROM ip_inventory")
+            cursor.execute("DELETE FROM ip_subnet_counters")
+            # Announce the wipe with it - the import may run for a long time or never finish
+            bump_shared_generation(cursor)
+            log_import_reset(cursor)
+            if identity:
+                checkpoint = dict(identity, byte_offset=0, rows_processed=0, rows_committed=0)
+                save_checkpoint(cursor, checkpoint)
         connection.commit()
         
         # Read CSV file
         print(f"📂 Reading CSV file: {csv_file_path}")
         
-        with open(csv_file_path, 'r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            
-            inserted_count = 0
-            skipped_count = 0
-            processed_count = 0
-            
-            print(f"📊 Starting data import...")
-            print("=" * 80)
-            
-            for row in csv_reader:
-                processed_count += 1
-                
-                # Apply limit if specified
-                if limit and processed_count > limit:
-                    break
+        resumed_from = checkpoint['rows_processed'] if checkpoint else 0
+        inserted_count = checkpoint['rows_committed'] if checkpoint else 0
+        counts = {
+            'processed': resumed_from,
+            'skipped': resumed_from - inserted_count,
+            'offset': checkpoint['byte_offset'] if checkpoint else 0
+        }
+        write_skipped = 0
+        batch = []
+        started_at = time.monotonic()
+        
+        print(f"📊 Starting data import (batch size {batch_size:,})...")
+        print("=" * 80)
+        
+        for values in normalized_rows(csv_file_path, limit, counts, workers, start_offset=counts['offset']):
+            batch.append(values)
+            if len(batch) >= batch_size:
+                inserted, skipped = write_batch(connection, cursor, batch, checkpoint,
+                                                byte_offset=counts['offset'], rows_processed=counts['processed'])
+                inserted_count += inserted
+                write_skipped += skipped
+                batch = []
                 
                 # Progress indicator
-                if processed_count % 1000 == 0:
-                    print(f"📈 Processed {processed_count:,} records, Inserted: {inserted_count:,}, Skipped: {skipped_count:,}")
-                
-                # Extract data from CSV row
-                ip_address = (row.get('ifIP') or '').strip()
-                host_name = (row.get('host_name') or '').strip()
-                if_name = (row.get('ifName') or '').strip()
-                if_descr = (row.get('ifDescr') or '').strip()
-                domain = (row.get('domain') or '').strip()
-                vendor = (row.get('vendor') or '').strip()
-                model = (row.get('model') or '').strip()
-                admin_status = (row.get('ifAdminStatus') or '').strip()
-                oper_status = (row.get('ifOperStatus') or '').strip()
-                
-                # Skip if no IP address or invalid IP
-                if not ip_address or ip_address == '-' or not is_valid_ip(ip_address):
-                    skipped_count += 1
-                    continue
-                
-                # Skip loopback IPs
-                if ip_address.startswith('127.'):
-                    skipped_count += 1
-                    continue
-                
-                # Calculate subnet
-                subnet = calculate_subnet_from_ip(ip_address)
-                if not subnet:
-                    skipped_count += 1
-                    continue
-                
-                # Extract VRF from domain
-                vrf_vpn = extract_vrf_from_domain(domain)
-                
-                # Determine status based on admin and operational status
-                if admin_status == 'Up' and oper_status == 'Up':
-                    status = 'used'
-                elif admin_status == 'Up' and oper_status == 'Down':
-                    status = 'reserved'
-                else:
-                    status = 'available'
-                
-                # Create description
-                description_parts = []
-                if if_name:
-                    description_parts.append(f"Interface: {if_name}")
-                if if_descr and if_descr != if_name:
-                    description_parts.append(f"Desc: {if_descr}")
-                if vendor:
-                    description_parts.append(f"Vendor: {vendor}")
-                if model:
-                    description_parts.append(f"Model: {model}")
-                
-                description = " | ".join(description_parts) if description_parts else f"Imported from CSV - {host_name}"
-                
-                # Create hostname
-                hostname = host_name if host_name else f"host-{ip_address.replace('.', '-')}"
-                
-                try:
-                    # Insert into database
-                    cursor.execute("""
-                        INSERT INTO ip_inventory 
-                        (ip_address, subnet, status, vrf_vpn, hostname, description)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON DUPLICATE KEY UPDATE
-                        status = VALUES(status),
-                        vrf_vpn = VALUES(vrf_vpn),
-                        hostname = VALUES(hostname),
-                        description = VALUES(description),
-                        updated_at = CURRENT_TIMESTAMP
-                    """, (ip_address, subnet, status, vrf_vpn, hostname, description))
-                    
-                    inserted_count += 1
-                    
-                except Error as e:
-                    if "Duplicate entry" not in str(e):
-                        print(f"⚠️ Error inserting {ip_address}: {e}")
-                    skipped_count += 1
+                rate = (counts['processed'] - resumed_from) / max(time.monotonic() - started_at, 1e-9)
+                print(f"📈 Processed {counts['processed']:,} records, Inserted: {inserted_count:,}, Skipped: {counts['skipped'] + write_skipped:,} ({rate:,.0f} rows/sec)")
+        
+        inserted, skipped = write_batch(connection, cursor, batch, checkpoint,
+                                        byte_offset=counts['offset'], rows_processed=counts['processed'])
+        inserted_count += inserted
+        processed_count = counts['processed']
+        skipped_count = processed_count - inserted_count
         
+        # Counters already follow every batch; the generation bump and change feed reset
+        # are committed with removing the checkpoint, so a finished import is never resumed
+        bump_shared_generation(cursor)
+        log_import_reset(cursor)
+        if checkpoint:
+            cursor.execute("DELETE FROM import_checkpoints WHERE file_path = %s", (checkpoint['file_path'],))
         connection.commit()
         cursor.close()
         connection.close()
         
+        elapsed = time.monotonic() - started_at
         print("=" * 80)
         print(f"✅ Import completed!")
         print(f"📊 Summary:")
         print(f"   - Total processed: {processed_count:,}")
         print(f"   - Successfully imported: {inserted_count:,}")
         print(f"   - Skipped: {skipped_count:,}")
-        print(f"   - Success rate: {(inserted_count/processed_count*100):.1f}%")
+        print(f"   - Success rate: {(inserted_count/processed_count*100 if processed_count else 0):.1f}%")
+        print(f"   - Elapsed: {elapsed:.1f}s ({(processed_count - resumed_from) / max(elapsed, 1e-9):,.0f} rows/sec)")
         
         return inserted_count
         
+    except KeyboardInterrupt:
+        print("\n⏸️ Import interrupted")
+        if checkpoint:
+            print(f"💡 Rerun with --resume to continue after record {checkpoint['rows_processed']:,}")
+        return 0
     except Exception as e:
         print(f"❌ Error during import: {e}")
+        if checkpoint:
+            print(f"💡 Rerun with --resume to continue after record {checkpoint['rows_processed']:,}")
         return 0
 
+def tsv_field(value):
+    """Escape a value for LOAD DATA's default tab-separated format (None becomes NULL)"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def import_csv_load_data(csv_file_path, limit=None, workers=1):
+    """Full reload via LOAD DATA LOCAL INFILE into staging tables and an atomic RENAME TABLE swap
+    
+    ip_inventory stays fully populated (old data) until the swap, so readers
+    never see an empty or half-loaded table. Writes made through the server
+    while the load runs are replaced, as with the regular full import.
+    """
+    staging_path = None
+    try:
+        connection = get_db_connection(allow_local_infile=True)
+        if not connection:
+            print("❌ Cannot connect to database")
+            return 0
+        cursor = connection.cursor()
+        ensure_import_tables(cursor)
+        started_at = time.monotonic()
+        
+        # 1. Normalize the CSV into a tab-separated staging file
+        counts = {'processed': 0, 'skipped': 0}
+        print(f"📂 Normalizing CSV file: {csv_file_path}")
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n', suffix='.tsv', delete=False) as staging:
+            staging_path = staging.name
+            written = 0
+            for values in normalized_rows(csv_file_path, limit, counts, workers):
+                staging.write('\t'.join(tsv_field(value) for value in values) + '\n')
+                written += 1
+                if written % 100000 == 0:
+                    rate = counts['processed'] / max(time.monotonic() - started_at, 1e-9)
+                    print(f"📈 Normalized {counts['processed']:,} records ({rate:,.0f} rows/sec)")
+        
+        # 2. Bulk load into staging copies of the live tables (same indexes)
+        print("📥 Loading staging table...")
+        cursor.execute("DROP TABLE IF EXISTS ip_inventory_staging, ip_subnet_counters_staging")
+        # The copied FULLTEXT index is built without stopwords, like main_server.py builds it
+        cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+        cursor.execute("CREATE TABLE ip_inventory_staging LIKE ip_inventory")
+        cursor.execute("CREATE TABLE ip_subnet_counters_staging LIKE ip_subnet_counters")
+        # REPLACE keeps the last row for a duplicated IP, like the upsert path
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s
+            REPLACE INTO TABLE ip_inventory_staging
+            CHARACTER SET utf8mb4
+            ({', '.join(IMPORT_COLUMNS)})
+        """, (staging_path,))
+        cursor.execute("SELECT COUNT(*) FROM ip_inventory_staging")
+        loaded_count = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO ip_subnet_counters_staging (subnet, vrf_vpn, status, ip_count)
+            SELECT subnet, COALESCE(vrf_vpn, ''), status, COUNT(*)
+            FROM ip_inventory_staging
+            WHERE status IS NOT NULL
+            GROUP BY subnet, COALESCE(vrf_vpn, ''), status
+        """)
+        connection.commit()
+        
+        # 3. Swap both tables in one atomic RENAME, then drop the old copies
+        print("🔀 Swapping staging tables into place...")
+        cursor.execute("DROP TABLE IF EXISTS ip_inventory_old, ip_subnet_counters_old")
+        cursor.execute("""
+            RENAME TABLE
+                ip_inventory TO ip_inventory_old,
+                ip_inventory_staging TO ip_inventory,
+                ip_subnet_counters TO ip_subnet_counters_old,
+                ip_subnet_counters_staging TO ip_subnet_counters
+        """)
+        cursor.execute("DROP TABLE ip_inventory_old, ip_subnet_counters_old")
+        
+        bump_shared_generation(cursor)
+        log_import_reset(cursor)
+        connection.commit()
+        cursor.close()
+        connection.close()
+        
+        elapsed = time.monotonic() - started_at
+        print("=" * 80)
+        print(f"✅ Import completed!")
+        print(f"📊 Summary:")
+        print(f"   - Total processed: {counts['processed']:,}")
+        print(f"   - Loaded rows: {loaded_count:,}")
+        print(f"   - Skipped: {counts['skipped']:,}")
+        print(f"   - Elapsed: {elapsed:.1f}s ({counts['processed'] / max(elapsed, 1e-9):,.0f} rows/sec)")
+        return loaded_count
+        
+    except Exception as e:
+        print(f"❌ Error during import: {e}")
+        if 'local' in str(e).lower() and 'infile' in str(e).lower():
+            print("💡 Enable it on the server with SET GLOBAL local_infile = 1, or use --mode batch")
+        return 0
+    finally:
+        if staging_path and os.path.exists(staging_path):
+            os.remove(staging_path)
+
+# ip_inventory columns read back for counter deltas and change log entries
+DELTA_ROW_FIELDS = ('id', 'ip_address', 'subnet', 'status', 'vrf_vpn', 'hostname', 'description', 'ip_int', 'content_hash')
+# Fields stored in ip_change_log.row_data (same as the server's IP_EVENT_FIELDS)
+CHANGE_ROW_FIELDS = ('id', 'ip_address', 'subnet', 'status', 'vrf_vpn', 'hostname', 'description')
+
+def load_stored_fingerprints(connection):
+    """ip_int -> content_hash for every ip_inventory row (None for manually managed rows)"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT ip_int, content_hash FROM ip_inventory WHERE ip_int IS NOT NULL")
+    stored = {}
+    while True:
+        rows = cursor.fetchmany(50000)
+        if not rows:
+            break
+        for ip_int, content_hash in rows:
+            stored[int(ip_int)] = content_hash
+    cursor.close()
+    return stored
+
+def fetch_rows_by_ip_int(cursor, ip_ints, lock=False):
+    """Current ip_inventory rows for ip_ints, as {ip_int: row dict} (lock: FOR UPDATE until commit)"""
+    if not ip_ints:
+        return {}
+    cursor.execute(f"""
+        SELECT {', '.join(DELTA_ROW_FIELDS)} FROM ip_inventory
+        WHERE ip_int IN ({', '.join(['%s'] * len(ip_ints))})
+        {'FOR UPDATE' if lock else ''}
+    """, list(ip_ints))
+    rows = {}
+    for values in cursor.fetchall():
+        row = dict(zip(DELTA_ROW_FIELDS, values))
+        rows[int(row['ip_int'])] = row
+    return rows
+
+def apply_counter_deltas(cursor, deltas):
+    """Apply aggregated {(subnet, vrf_vpn, status): delta} to ip_subnet_counters, dropping rows that reach zero"""
+    deltas = [(key, delta) for key, delta in deltas.items() if delta]
+    if not deltas:
+        return
+    cursor.execute(f"""
+        INSERT INTO ip_subnet_counters (subnet, vrf_vpn, status, ip_count)
+        VALUES {', '.join(['(%s, %s, %s, %s)'] * len(deltas))}
+        ON DUPLICATE KEY UPDATE ip_count = ip_count + VALUES(ip_count)
+    """, [value for key, delta in deltas for value in key + (delta,)])
+    emptied = [key for key, delta in deltas if delta < 0]
+    if emptied:
+        cursor.execute(f"""
+            DELETE FROM ip_subnet_counters
+            WHERE (subnet, vrf_vpn, status) IN ({', '.join(['(%s, %s, %s)'] * len(emptied))}) AND ip_count <= 0
+        """, [value for key in emptied for value in key])
+
+def log_delta_changes(cursor, entries):
+    """Append (op, ip_address, old_ip_address, row) entries to ip_change_log with one seq range"""
+    if not entries:
+        return
+    cursor.execute("""
+        INSERT INTO ipam_meta (name, value) VALUES ('change_seq', LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE value = LAST_INSERT_ID(value + %s)
+    """, (len(entries), len(entries)))
+    first_seq = cursor.lastrowid - len(entries) + 1
+    cursor.execute(f"""
+        INSERT INTO ip_change_log (seq, op, ip_address, old_ip_address, row_data)
+        VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(entries))}
+    """, [
+        value
+        for seq, (op, ip_address, old_ip_address, row) in enumerate(entries, first_seq)
+        for value in (seq, op, ip_address, old_ip_address,
+                      json.dumps({field: row[field] for field in CHANGE_ROW_FIELDS}, default=str) if row else None)
+    ])
+
+# Change log op -> apply_delta_batch result key
+DELTA_RESULT_KEYS = {'insert': 'inserted', 'update': 'updated', 'delete': 'deleted'}
+
+def apply_delta_batch(connection, cursor, upserts, deletes):
+    """Write one delta batch - upserted rows, deleted ip_ints, counter deltas and change log in one transaction
+    
+    The affected rows are locked and re-checked first: one edited in the UI
+    since the fingerprints were loaded (content_hash now NULL) is left alone.
+    Returns counts of rows inserted, updated, deleted and kept as manual.
+    """
+    result = {'inserted': 0, 'updated': 0, 'deleted': 0, 'kept_manual': 0}
+    if not upserts and not deletes:
+        return result
+    try:
+        old_rows = fetch_rows_by_ip_int(cursor, [values[6] for values in upserts] + deletes, lock=True)
+        manual = {ip_int for ip_int, row in old_rows.items() if row['content_hash'] is None}
+        if manual:
+            upserts = [values for values in upserts if values[6] not in manual]
+            deletes = [ip_int for ip_int in deletes if ip_int not in manual]
+            result['kept_manual'] = len(manual)
+        if upserts:
+            cursor.execute(upsert_sql(len(upserts)), [value for values in upserts for value in values])
+        if deletes:
+            cursor.execute(f"""
+                DELETE FROM ip_inventory WHERE ip_int IN ({', '.join(['%s'] * len(deletes))})
+            """, deletes)
+        new_rows = fetch_rows_by_ip_int(cursor, [values[6] for values in upserts])
+
+        counter_deltas = {}
+        entries = []
+        for ip_int in dict.fromkeys([values[6] for values in upserts] + deletes):
+            old_row = old_rows.get(ip_int)
+            new_row = new_rows.get(ip_int)
+            for row, delta in ((old_row, -1), (new_row, 1)):
+                if row and row['status']:
+                    key = (row['subnet'], row['vrf_vpn'] or '', row['status'])
+                    counter_deltas[key] = counter_deltas.get(key, 0) + delta
+            if old_row is None and new_row is not None:
+                entries.append(('insert', new_row['ip_address'], None, new_row))
+            elif old_row is not None and new_row is None:
+                entries.append(('delete', old_row['ip_address'], old_row['ip_address'], None))
+            elif old_row is not None:
+                entries.append(('update', new_row['ip_address'], old_row['ip_address'], new_row))
+        apply_counter_deltas(cursor, counter_deltas)
+        log_delta_changes(cursor, entries)
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    for op, _, _, _ in entries:
+        result[DELTA_RESULT_KEYS[op]] += 1
+    return result
+
+def add_counts(totals, counts):
+    for name, count in counts.items():
+        totals[name] += count
+
+def import_csv_delta(csv_file_path, limit=None, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """Apply only what changed since the last import, using per-row content fingerprints
+
+    Every imported row carries content_hash. CSV rows whose fingerprint
+    matches the stored one are not written at all; new addresses are
+    inserted, changed ones updated and imported addresses missing from the
+    file deleted. Rows added or edited through the UI (content_hash NULL)
+    are never touched - which includes rows imported before content_hash
+    existed, so an existing install needs one full batch/load import first.
+    Counters and the change feed are updated per batch, so a run that is
+    interrupted can simply be repeated.
+    """
+    try:
+        connection = get_db_connection()
+        if not connection:
+            print("❌ Cannot connect to database")
+            return None
+        cursor = connection.cursor()
+        ensure_import_tables(cursor)
+        connection.commit()
+        started_at = time.monotonic()
+
+        print("🔎 Loading stored fingerprints...")
+        stored = load_stored_fingerprints(connection)
+        print(f"   {len(stored):,} rows in ip_inventory")
+        if stored and all(content_hash is None for content_hash in stored.values()):
+            print("⚠️ No row has a fingerprint yet (imported before delta mode, or all edited manually) -")
+            print("   they are all kept as manual. Run one full import (--mode batch or load) first.")
+
+        counts = {'processed': 0, 'skipped': 0}
+        classes = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'kept_manual': 0}
+        upserts = {}  # ip_int -> values, so a repeated address in one batch keeps the last row
+
+        print(f"📂 Comparing CSV file: {csv_file_path}")
+        print("=" * 80)
+        for values in normalized_rows(csv_file_path, limit, counts, workers):
+            ip_int, content_hash = values[6], values[7]
+            if ip_int in stored:
+                stored_hash = stored[ip_int]
+                if stored_hash is None:
+                    classes['kept_manual'] += 1
+                    continue
+                if isinstance(stored_hash, tuple):
+                    # Address repeated in the file - the last row wins, as in batch mode
+                    if stored_hash[0] == content_hash:
+                        continue
+                elif stored_hash == content_hash:
+                    classes['unchanged'] += 1
+                    stored[ip_int] = (content_hash,)
+                    continue
+            # Inserts and updates are counted by apply_delta_batch as written
+            # A tuple marks an address seen in this file (and what it now holds)
+            stored[ip_int] = (content_hash,)
+            upserts[ip_int] = values
+
+            if len(upserts) >= batch_size:
+                add_counts(classes, apply_delta_batch(connection, cursor, list(upserts.values()), []))
+                upserts = {}
+                rate = counts['processed'] / max(time.monotonic() - started_at, 1e-9)
+                print(f"📈 Processed {counts['processed']:,} records, Inserted: {classes['inserted']:,}, Updated: {classes['updated']:,} ({rate:,.0f} rows/sec)")
+        add_counts(classes, apply_delta_batch(connection, cursor, list(upserts.values()), []))
+
+        # Imported rows the file no longer contains (only meaningful when the whole file was read)
+        if limit:
+            print("⚠️ --limit set: leaving rows missing from the file in place")
+        else:
+            missing = [ip_int for ip_int, content_hash in stored.items() if isinstance(content_hash, int)]
+            for start in range(0, len(missing), batch_size):
+                add_counts(classes, apply_delta_batch(connection, cursor, [], missing[start:start + batch_size]))
+
+        if classes['inserted'] or classes['updated'] or classes['deleted']:
+            bump_shared_generation(cursor)
+            connection.commit()
+        cursor.close()
+        connection.close()
+
+        elapsed = time.monotonic() - started_at
+        touched = classes['inserted'] + classes['updated'] + classes['deleted']
+        print("=" * 80)
+        print(f"✅ Delta import completed!")
+        print(f"📊 Summary:")
+        print(f"   - Total processed: {counts['processed']:,}")
+        print(f"   - Inserted: {classes['inserted']:,}")
+        print(f"   - Updated: {classes['updated']:,}")
+        print(f"   - Deleted: {classes['deleted']:,}")
+        print(f"   - Unchanged: {classes['unchanged']:,}")
+        print(f"   - Kept (manually managed): {classes['kept_manual']:,}")
+        if classes['kept_manual'] and not (classes['unchanged'] or classes['updated']):
+            print("     (no imported row matched a fingerprint - run one full --mode batch/load import to enable delta updates)")
+        print(f"   - Skipped: {counts['skipped']:,}")
+        print(f"   - Rows written: {touched:,} ({(touched/counts['processed']*100 if counts['processed'] else 0):.1f}% of processed)")
+        print(f"   - Elapsed: {elapsed:.1f}s ({counts['processed'] / max(elapsed, 1e-9):,.0f} rows/sec)")
+        return classes
+
+    except Exception as e:
+        print(f"❌ Error during import: {e}")
+        print("💡 Batches already written are consistent - rerun the delta import to finish")
+        return None
+
 def analyze_csv_structure(csv_file_path, sample_rows=10):
     """Analyze CSV structure and show sample data"""
     try:
         print(f"🔍 Analyzing CSV structure: {csv_file_path}")
         print("=" * 80)
         
-        with open(csv_file_path, 'r', encoding='utf-8') as file:
+        with io.TextIOWrapper(open_csv_input(csv_file_path), encoding='utf-8', newline='') as file:
             csv_reader = csv.DictReader(file)
             
             # Show headers
@@ -254,31 +1106,84 @@ def analyze_csv_structure(csv_file_path, sample_rows=10):
     except Exception as e:
         print(f"❌ Error analyzing CSV: {e}")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import the datalake port inventory CSV into ip_inventory")
+    parser.add_argument('csv_file', nargs='?', default='datalake.Inventory.port.csv',
+                        help="CSV file to import, optionally gzip/bz2/xz compressed, or - for stdin")
+    parser.add_argument('--limit', type=int, help="Import at most this many CSV records")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per multi-row INSERT and commit")
+    parser.add_argument('--mode', choices=('batch', 'load', 'delta'), default='batch',
+                        help="batch: multi-row INSERTs into the live table; load: LOAD DATA into a staging table and swap it in; "
+                             "delta: write only rows whose content changed since the last import")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to parse and normalize the CSV (1 = no pool); output is identical for any value")
+    parser.add_argument('--vrf-mapping', metavar='JSON',
+                        help="Domain substring -> VRF rules, first match wins (default: $IPAM_VRF_MAPPING or vrf_mapping.json)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted batch import from its last committed batch (same file, not cleared)")
+    parser.add_argument('--yes', '-y', action='store_true', help="Skip the confirmation prompts")
+    args = parser.parse_args(argv)
+    if args.resume and args.mode == 'load':
+        parser.error("--resume applies to --mode batch (a load either swaps in completely or not at all)")
+    if args.csv_file == STDIN_PATH:
+        if args.resume:
+            parser.error("--resume needs a file - stdin cannot be re-read")
+        if not args.yes:
+            parser.error("reading the CSV from stdin requires --yes (the prompts would read stdin too)")
+    return args
+
 if __name__ == '__main__':
-    csv_file = 'datalake.Inventory.port.csv'
+    args = parse_args()
+    csv_file = args.csv_file
     
     print("🚀 IPAM CSV Import Tool")
     print("=" * 80)
     
-    # Analyze CSV structure first
-    analyze_csv_structure(csv_file, sample_rows=5)
+    try:
+        set_vrf_mapping(load_vrf_mapping(args.vrf_mapping))
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot load VRF mapping: {e}")
+        sys.exit(1)
+    print(f"🏷️ {len(vrf_classifier.rules)} VRF rules loaded")
+    
+    # Analyze CSV structure first (stdin can only be read once)
+    if csv_file != STDIN_PATH:
+        analyze_csv_structure(csv_file, sample_rows=5)
     
-    # Ask for confirmation
-    print("\n" + "=" * 80)
-    confirm = input("🤔 Proceed with import? This will replace existing data. (y/N): ").strip().lower()
-    
-    if confirm in ['y', 'yes']:
-        # Ask for limit
-        limit_input = input("📊 Import limit (press Enter for all data, or number): ").strip()
-        limit = None
-        if limit_input.isdigit():
-            limit = int(limit_input)
-            print(f"📝 Will import maximum {limit:,} records")
+    limit = args.limit
+    if not args.yes:
+        # Ask for confirmation
+        print("\n" + "=" * 80)
+        if args.mode == 'delta':
+            effect = "This will apply changes since the last import."
+        elif args.resume:
+            effect = "This will continue the interrupted import."
         else:
-            print("📝 Will import all valid data")
+            effect = "This will replace existing data."
+        confirm = input(f"🤔 Proceed with import? {effect} (y/N): ").strip().lower()
+        if confirm not in ['y', 'yes']:
+            print("❌ Import cancelled")
+            sys.exit(0)
         
-        # Import data
-        print("\n" + "=" * 80)
-        import_csv_data(csv_file, limit=limit)
+        if limit is None:
+            # Ask for limit
+            limit_input = input("📊 Import limit (press Enter for all data, or number): ").strip()
+            if limit_input.isdigit():
+                limit = int(limit_input)
+    
+    if limit:
+        print(f"📝 Will import maximum {limit:,} records")
+    else:
+        print("📝 Will import all valid data")
+    
+    # Import data
+    print("\n" + "=" * 80)
+    if args.mode == 'load':
+        import_csv_load_data(csv_file, limit=limit, workers=args.workers)
+    elif args.mode == 'delta':
+        if args.resume:
+            print("💡 Delta imports need no checkpoint - rerunning one picks up where it stopped")
+        import_csv_delta(csv_file, limit=limit, batch_size=max(args.batch_size, 1), workers=args.workers)
     else:
-        print("❌ Import cancelled")
+        import_csv_data(csv_file, limit=limit, batch_size=max(args.batch_size, 1), workers=args.workers, resume=args.resume)
+    report_vrf_hits()
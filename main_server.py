@@ -4,12 +4,23 @@ Simple IP Address Management System
 Only IP Management functionality
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, g, has_app_context, stream_with_context
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import IntegrityError, PoolError
 import json
+import base64
+import functools
+import hashlib
+from collections import OrderedDict, deque
 from datetime import datetime
 import ipaddress
+import os
+import queue
+import re
+import sys
+import threading
+import time
 
 app = Flask(__name__)
 
@@ -21,15 +32,703 @@ DB_CONFIG = {
     'database': 'ipam_db'
 }
 
+# Connection Pool Configuration (override with environment variables)
+DB_POOL_CONFIG = {
+    'pool_size': int(os.environ.get('IPAM_DB_POOL_SIZE', 10)),
+    'acquire_timeout': float(os.environ.get('IPAM_DB_POOL_TIMEOUT', 5)),  # seconds to wait for a free connection
+    'ping_after_idle': float(os.environ.get('IPAM_DB_POOL_PING_AFTER', 1))  # ping connections idle longer than this
+}
+
+class PooledConnection:
+    """Connection borrowed from the pool - close() returns it instead of disconnecting"""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class DBConnectionPool:
+    """Bounded pool of MySQL connections with liveness check and saturation stats"""
+
+    def __init__(self, config, pool_size=10, acquire_timeout=5.0, ping_after_idle=1.0):
+        self.config = config
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_after_idle = ping_after_idle
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._idle = queue.LifoQueue()  # (connection, returned_at) - reuse the warmest connection first
+        self._lock = threading.Lock()
+        self._stats = {
+            'in_use': 0,
+            'peak_in_use': 0,
+            'acquired': 0,
+            'waited': 0,
+            'timeouts': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'created': 0,
+            'discarded': 0
+        }
+
+    def acquire(self):
+        """Borrow a connection, waiting at most acquire_timeout seconds for a free slot"""
+        started = time.monotonic()
+        waited = False
+        if not self._slots.acquire(blocking=False):
+            waited = True
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                print(f"⚠️ DB pool exhausted: {self.pool_size} connections in use for {self.acquire_timeout}s")
+                raise PoolError(f"No database connection available within {self.acquire_timeout}s")
+
+        try:
+            connection = self._take_idle_connection()
+            if connection is None:
+                connection = mysql.connector.connect(**self.config)
+                with self._lock:
+                    self._stats['created'] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+            if waited:
+                self._stats['waited'] += 1
+                self._stats['wait_ms_total'] += wait_ms
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+
+        return PooledConnection(self, connection)
+
+    def _take_idle_connection(self):
+        """Pop idle connections until one passes the liveness check"""
+        while True:
+            try:
+                connection, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+
+            if time.monotonic() - returned_at < self.ping_after_idle:
+                return connection
+
+            try:
+                connection.ping(reconnect=False)
+                return connection
+            except Error:
+                self._discard(connection)
+
+    def release(self, connection):
+        """Give a connection back to the pool, rolling back any uncommitted work"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put((connection, time.monotonic()))
+        except Error:
+            self._discard(connection)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def _discard(self, connection):
+        with self._lock:
+            self._stats['discarded'] += 1
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def status(self):
+        """Pool usage figures for sizing"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pool_size'] = self.pool_size
+        stats['idle'] = self._idle.qsize()
+        stats['saturation_percent'] = round(stats['in_use'] / self.pool_size * 100, 2) if self.pool_size else 0
+        stats['peak_saturation_percent'] = round(stats['peak_in_use'] / self.pool_size * 100, 2) if self.pool_size else 0
+        stats['avg_wait_ms'] = round(stats['wait_ms_total'] / stats['waited'], 2) if stats['waited'] else 0
+        stats['wait_ms_total'] = round(stats['wait_ms_total'], 2)
+        stats['wait_ms_max'] = round(stats['wait_ms_max'], 2)
+        return stats
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Get (and lazily create) the shared connection pool"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = DBConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    return _db_pool
+
 def get_db_connection():
-    """Get database connection"""
+    """Get database connection from the pool (returned on close() or at request teardown)"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = get_db_pool().acquire()
+        if has_app_context():
+            g.setdefault('db_connections', []).append(connection)
         return connection
     except Error as e:
         print(f"❌ Database connection error: {e}")
         return None
 
+def ip_to_int(ip_str):
+    """Convert IPv4/IPv6 address string to its integer value (ip_int column)"""
+    return int(ipaddress.ip_address(ip_str))
+
+def ensure_column(cursor, table, column, definition):
+    """Add column to an existing table if it is missing"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"🔧 Added column {table}.{column}")
+
+def ensure_index(cursor, table, index, definition):
+    """Add index to an existing table if it is missing"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} {definition}")
+        print(f"🔧 Added index {table}.{index}")
+
+def backfill_ip_int(connection, cursor, batch_size=50000):
+    """Fill ip_int for rows created before the column existed"""
+    backfilled = 0
+    
+    # IPv4 rows can be converted by MySQL directly, in batches to keep transactions small
+    while True:
+        cursor.execute("""
+            UPDATE ip_inventory SET ip_int = INET_ATON(ip_address)
+            WHERE ip_int IS NULL AND IS_IPV4(ip_address)
+            LIMIT %s
+        """, (batch_size,))
+        connection.commit()
+        backfilled += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    
+    # Anything left (IPv6) is converted in Python
+    cursor.execute("SELECT id, ip_address FROM ip_inventory WHERE ip_int IS NULL")
+    for row_id, ip_address in cursor.fetchall():
+        try:
+            cursor.execute("UPDATE ip_inventory SET ip_int = %s WHERE id = %s", (ip_to_int(ip_address), row_id))
+            backfilled += 1
+        except ValueError:
+            print(f"⚠️ Cannot convert IP address {ip_address} (id {row_id})")
+    connection.commit()
+    
+    if backfilled:
+        print(f"🔧 Backfilled ip_int for {backfilled:,} rows")
+
+class _PrefixNode:
+    __slots__ = ('children', 'network', 'data')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.network = None
+        self.data = None
+
+class PrefixTrie:
+    """Binary radix tree of IPv4/IPv6 prefixes
+    
+    Supports longest-prefix match, covering (supernet) and covered-by
+    (subnet) queries and enumeration of the nearest child prefixes, each in
+    O(prefix length) plus the size of the answer.
+    """
+
+    def __init__(self):
+        self._roots = {4: _PrefixNode(), 6: _PrefixNode()}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _as_network(prefix):
+        if isinstance(prefix, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return prefix
+        if isinstance(prefix, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            return ipaddress.ip_network(prefix)
+        return ipaddress.ip_network(prefix, strict=False)
+
+    @staticmethod
+    def _bits(network):
+        """Yield the prefix bits of a network, most significant first"""
+        value = int(network.network_address)
+        max_bits = network.max_prefixlen
+        for i in range(network.prefixlen):
+            yield (value >> (max_bits - 1 - i)) & 1
+
+    def _walk(self, network):
+        """Yield nodes along the path to network (root first), stopping where the path ends"""
+        node = self._roots[network.version]
+        yield node
+        for bit in self._bits(network):
+            node = node.children[bit]
+            if node is None:
+                return
+            yield node
+
+    def insert(self, prefix, data=None):
+        """Add a prefix (or replace its data)"""
+        network = self._as_network(prefix)
+        with self._lock:
+            node = self._roots[network.version]
+            for bit in self._bits(network):
+                if node.children[bit] is None:
+                    node.children[bit] = _PrefixNode()
+                node = node.children[bit]
+            if node.network is None:
+                self._size += 1
+            node.network = network
+            node.data = data
+
+    def remove(self, prefix):
+        """Remove a prefix, pruning branches left empty - returns True if it was present"""
+        network = self._as_network(prefix)
+        with self._lock:
+            path = list(self._walk(network))
+            if len(path) != network.prefixlen + 1 or path[-1].network is None:
+                return False
+            path[-1].network = None
+            path[-1].data = None
+            self._size -= 1
+            
+            bits = list(self._bits(network))
+            for depth in range(len(path) - 1, 0, -1):
+                node = path[depth]
+                if node.network is not None or node.children[0] or node.children[1]:
+                    break
+                path[depth - 1].children[bits[depth - 1]] = None
+            return True
+
+    def get(self, prefix):
+        """Data stored for an exact prefix, or None"""
+        network = self._as_network(prefix)
+        with self._lock:
+            path = list(self._walk(network))
+            if len(path) == network.prefixlen + 1 and path[-1].network is not None:
+                return path[-1].data
+        return None
+
+    def __contains__(self, prefix):
+        network = self._as_network(prefix)
+        with self._lock:
+            path = list(self._walk(network))
+            return len(path) == network.prefixlen + 1 and path[-1].network is not None
+
+    def covering(self, prefix):
+        """All stored prefixes containing prefix (itself included), shortest first, as (network, data)"""
+        network = self._as_network(prefix)
+        with self._lock:
+            return [(node.network, node.data) for node in self._walk(network) if node.network is not None]
+
+    def longest_match(self, prefix):
+        """Most specific stored prefix containing an address or prefix, as (network, data) or None"""
+        matches = self.covering(prefix)
+        return matches[-1] if matches else None
+
+    def covered_by(self, prefix):
+        """All stored prefixes inside prefix (itself included), in address order, as (network, data)"""
+        network = self._as_network(prefix)
+        with self._lock:
+            path = list(self._walk(network))
+            if len(path) != network.prefixlen + 1:
+                return []
+            results = []
+            stack = [path[-1]]
+            while stack:
+                node = stack.pop()
+                if node.network is not None:
+                    results.append((node.network, node.data))
+                # Push 1-branch first so the 0-branch (lower addresses) is visited first
+                for child in (node.children[1], node.children[0]):
+                    if child is not None:
+                        stack.append(child)
+            return results
+
+    def children(self, prefix):
+        """Nearest stored prefixes strictly inside prefix (not nested in another result)"""
+        network = self._as_network(prefix)
+        with self._lock:
+            path = list(self._walk(network))
+            if len(path) != network.prefixlen + 1:
+                return []
+            results = []
+            stack = [child for child in (path[-1].children[1], path[-1].children[0]) if child is not None]
+            while stack:
+                node = stack.pop()
+                if node.network is not None:
+                    results.append((node.network, node.data))
+                    continue
+                for child in (node.children[1], node.children[0]):
+                    if child is not None:
+                        stack.append(child)
+            return results
+
+# Network type folders for /api/network-tree, matched by longest prefix
+NETWORK_TYPE_PREFIXES = {
+    '10.0.0.0/8': 'Private_10.x.x.x',
+    '172.0.0.0/8': 'Private_172.x.x.x',
+    '192.0.0.0/8': 'Private_192.x.x.x',
+    '1.0.0.0/8': 'Public_Networks',
+    '5.0.0.0/8': 'Public_Networks',
+    '6.0.0.0/8': 'Public_Networks',
+    '9.0.0.0/8': 'Public_Networks'
+}
+
+_network_type_trie = PrefixTrie()
+for _prefix, _net_type in NETWORK_TYPE_PREFIXES.items():
+    _network_type_trie.insert(_prefix, _net_type)
+
+def classify_network_type(prefix):
+    """Network type folder name for a subnet"""
+    match = _network_type_trie.longest_match(prefix)
+    return match[1] if match else "Other_Networks"
+
+# In-process index of all known subnets (data = number of ip_inventory rows)
+_prefix_index = None
+_prefix_index_lock = threading.Lock()
+
+def load_prefix_index():
+    """(Re)build the subnet prefix index from ip_subnet_counters"""
+    global _prefix_index
+    trie = PrefixTrie()
+    connection = get_db_connection()
+    if not connection:
+        return _prefix_index
+    
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT subnet, SUM(ip_count) FROM ip_subnet_counters GROUP BY subnet")
+        for subnet, ip_count in cursor.fetchall():
+            try:
+                trie.insert(subnet, int(ip_count))
+            except ValueError:
+                print(f"⚠️ Skipping invalid subnet in prefix index: {subnet}")
+        cursor.close()
+    except Error as e:
+        print(f"❌ Error loading prefix index: {e}")
+        return _prefix_index
+    finally:
+        connection.close()
+    
+    with _prefix_index_lock:
+        _prefix_index = trie
+    print(f"🌳 Prefix index loaded ({len(trie):,} subnets)")
+    return trie
+
+def get_prefix_index():
+    """Get the subnet prefix index, loading it on first use"""
+    if _prefix_index is None:
+        load_prefix_index()
+    return _prefix_index if _prefix_index is not None else PrefixTrie()
+
+def _adjust_prefix_index(subnet, delta):
+    if _prefix_index is None or not subnet:
+        return
+    try:
+        network = ipaddress.ip_network(subnet, strict=False)
+    except ValueError:
+        return
+    with _prefix_index_lock:
+        count = (_prefix_index.get(network) or 0) + delta
+        if count > 0:
+            _prefix_index.insert(network, count)
+        else:
+            _prefix_index.remove(network)
+    return count
+
+# Identifies this server process (event ids and ETags must not match across restarts)
+_process_instance = f"{os.getpid():x}{int(time.time()):x}"
+
+# Event Stream Configuration
+EVENT_STREAM_CONFIG = {
+    'buffer_size': int(os.environ.get('IPAM_EVENT_BUFFER_SIZE', 1000)),  # events kept for Last-Event-ID replay
+    'client_queue_size': int(os.environ.get('IPAM_EVENT_CLIENT_QUEUE', 256)),
+    'keepalive': float(os.environ.get('IPAM_EVENT_KEEPALIVE', 15))
+}
+
+class _EventClient:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lagging = False
+
+class EventBroker:
+    """Fan out change events to Server-Sent Events clients
+    
+    Events get a per-process sequence number and are kept in a ring buffer
+    so a reconnecting client can replay what it missed. A client whose
+    queue fills up is dropped; its browser reconnects and replays.
+    """
+
+    def __init__(self, buffer_size=1000, client_queue_size=256, keepalive=15.0):
+        self.keepalive = keepalive
+        self.client_queue_size = client_queue_size
+        self._buffer = deque(maxlen=buffer_size)  # (seq, event_type, json payload)
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def publish(self, event_type, data):
+        payload = json.dumps(data, default=str)
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, event_type, payload)
+            self._buffer.append(event)
+            for client in list(self._clients):
+                try:
+                    client.queue.put_nowait(event)
+                except queue.Full:
+                    client.lagging = True
+                    self._clients.discard(client)
+        return self._seq
+
+    def subscribe(self, last_seq=None):
+        """Register a client; returns (client, replay, last_seq) where replay is None if events were lost"""
+        client = _EventClient(self.client_queue_size)
+        with self._lock:
+            replay = []
+            if last_seq is not None:
+                oldest = self._buffer[0][0] if self._buffer else self._seq + 1
+                if last_seq > self._seq or last_seq < oldest - 1:
+                    replay = None
+                else:
+                    replay = [event for event in self._buffer if event[0] > last_seq]
+            self._clients.add(client)
+            return client, replay, self._seq
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def status(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'last_event': self._seq,
+                'buffered': len(self._buffer),
+                'buffer_size': self._buffer.maxlen
+            }
+
+_event_broker = EventBroker(**EVENT_STREAM_CONFIG)
+
+# Fields sent to clients for ip.* events
+IP_EVENT_FIELDS = ('id', 'ip_address', 'subnet', 'status', 'vrf_vpn', 'hostname', 'description')
+
+def publish_ip_change(old_row, new_row):
+    """Update in-process state after an ip_inventory change has been committed"""
+    generation = bump_data_generation()
+    old_subnet = old_row['subnet'] if old_row else None
+    new_subnet = new_row['subnet'] if new_row else None
+    subnets_changed = False
+    if old_subnet != new_subnet:
+        # A subnet appearing or disappearing changes totals clients cannot patch themselves
+        subnets_changed = _adjust_prefix_index(old_subnet, -1) == 0
+        subnets_changed = _adjust_prefix_index(new_subnet, 1) == 1 or subnets_changed
+    _update_allocation_bitmaps(old_row, new_row)
+    
+    event_type = 'ip.added' if old_row is None else 'ip.deleted' if new_row is None else 'ip.updated'
+    event = {'generation': generation}
+    if new_row:
+        event['ip'] = {field: new_row.get(field) for field in IP_EVENT_FIELDS}
+    if old_row:
+        event['old'] = {field: old_row.get(field) for field in IP_EVENT_FIELDS}
+    _event_broker.publish(event_type, event)
+    
+    old_key = counter_key(old_row) if old_row else None
+    new_key = counter_key(new_row) if new_row else None
+    if old_key != new_key:
+        deltas = [
+            {'subnet': key[0], 'vrf_vpn': key[1], 'status': key[2], 'delta': delta}
+            for key, delta in ((old_key, -1), (new_key, 1)) if key
+        ]
+        _event_broker.publish('subnet.counters', {'generation': generation, 'deltas': deltas, 'subnets_changed': subnets_changed})
+
+def publish_reset(reason):
+    """Tell event stream clients to reload everything (bulk changes that have no per-row events)"""
+    _event_broker.publish('reset', {'generation': current_data_generation(), 'reason': reason})
+
+# ip_inventory columns written by add/update (in INSERT order)
+IP_ROW_FIELDS = ('ip_address', 'subnet', 'status', 'vrf_vpn', 'hostname', 'description', 'ip_int')
+
+def counter_key(row):
+    """ip_subnet_counters key for an ip_inventory row (NULL VRF is stored as '')"""
+    return (row['subnet'], row.get('vrf_vpn') or '', row['status'])
+
+def apply_counter_delta(cursor, key, delta):
+    """Adjust one ip_subnet_counters row, dropping it when it reaches zero"""
+    cursor.execute("""
+        INSERT INTO ip_subnet_counters (subnet, vrf_vpn, status, ip_count)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ip_count = ip_count + VALUES(ip_count)
+    """, key + (delta,))
+    if delta < 0:
+        cursor.execute("""
+            DELETE FROM ip_subnet_counters
+            WHERE subnet = %s AND vrf_vpn = %s AND status = %s AND ip_count <= 0
+        """, key)
+
+# Change Log Configuration
+CHANGE_LOG_CONFIG = {
+    'retention_days': float(os.environ.get('IPAM_CHANGE_LOG_RETENTION_DAYS', 7)),
+    'max_rows': int(os.environ.get('IPAM_CHANGE_LOG_MAX_ROWS', 1000000)),
+    'compact_interval': float(os.environ.get('IPAM_CHANGE_LOG_COMPACT_INTERVAL', 3600))  # seconds, run by the poller
+}
+CHANGE_SEQ_KEY = 'change_seq'
+CHANGE_FLOOR_KEY = 'change_log_floor'  # highest seq removed by compaction
+
+def next_change_seq(cursor):
+    """Allocate the next change log sequence number inside the caller's transaction
+    
+    The ipam_meta row stays locked until commit, so sequence order is commit
+    order and readers never see a gap fill in behind them.
+    """
+    cursor.execute(
+        "UPDATE ipam_meta SET value = LAST_INSERT_ID(value + 1) WHERE name = %s",
+        (CHANGE_SEQ_KEY,)
+    )
+    return cursor.lastrowid
+
+def log_ip_change(cursor, old_row, new_row):
+    """Append one ip_inventory change to ip_change_log (same transaction as the change)"""
+    op = 'insert' if old_row is None else 'delete' if new_row is None else 'update'
+    row = new_row or old_row
+    data = {field: new_row.get(field) for field in IP_EVENT_FIELDS} if new_row else None
+    cursor.execute("""
+        INSERT INTO ip_change_log (seq, op, ip_address, old_ip_address, row_data)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (
+        next_change_seq(cursor), op, row['ip_address'],
+        old_row['ip_address'] if old_row else None,
+        json.dumps(data, default=str) if data else None
+    ))
+
+def record_ip_change(cursor, old_row, new_row):
+    """Update derived tables for one ip_inventory change - call before commit
+    
+    old_row is None for inserts and new_row is None for deletes.
+    """
+    old_key = counter_key(old_row) if old_row else None
+    new_key = counter_key(new_row) if new_row else None
+    if old_key != new_key:
+        if old_key:
+            apply_counter_delta(cursor, old_key, -1)
+        if new_key:
+            apply_counter_delta(cursor, new_key, 1)
+    log_ip_change(cursor, old_row, new_row)
+
+def compact_change_log(retention_days=None, max_rows=None, batch_size=10000):
+    """Drop change log entries older than retention_days or beyond the newest max_rows
+    
+    Consumers whose cursor falls below the compacted range get 410 from
+    /api/changes and must resync from /api/ip-data. Returns rows removed.
+    """
+    retention_days = CHANGE_LOG_CONFIG['retention_days'] if retention_days is None else retention_days
+    max_rows = CHANGE_LOG_CONFIG['max_rows'] if max_rows is None else max_rows
+    connection = get_db_connection()
+    if not connection:
+        return 0
+    
+    removed = 0
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(seq) FROM ip_change_log")
+        max_seq = cursor.fetchone()[0] or 0
+        cursor.execute(
+            "SELECT MAX(seq) FROM ip_change_log WHERE changed_at < NOW() - INTERVAL %s SECOND",
+            (int(retention_days * 86400),)
+        )
+        cutoff = max(cursor.fetchone()[0] or 0, max_seq - max_rows)
+        if cutoff <= 0:
+            cursor.close()
+            return 0
+        
+        # Publish the new floor first so readers report 410 rather than a silent gap
+        cursor.execute(
+            "UPDATE ipam_meta SET value = GREATEST(value, %s) WHERE name = %s",
+            (cutoff, CHANGE_FLOOR_KEY)
+        )
+        connection.commit()
+        while True:
+            cursor.execute("DELETE FROM ip_change_log WHERE seq <= %s LIMIT %s", (cutoff, batch_size))
+            connection.commit()
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+        cursor.close()
+        if removed:
+            print(f"🧹 Compacted change log ({removed:,} entries up to seq {cutoff})")
+    except Error as e:
+        connection.rollback()
+        print(f"❌ Error compacting change log: {e}")
+    finally:
+        connection.close()
+    return removed
+
+def rebuild_subnet_counters(connection=None):
+    """Recompute ip_subnet_counters from ip_inventory (repairs drift)"""
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+        if not connection:
+            return False
+    
+    try:
+        cursor = connection.cursor()
+        # DELETE (not TRUNCATE) so the swap happens in a single transaction
+        cursor.execute("DELETE FROM ip_subnet_counters")
+        cursor.execute("""
+            INSERT INTO ip_subnet_counters (subnet, vrf_vpn, status, ip_count)
+            SELECT subnet, COALESCE(vrf_vpn, ''), status, COUNT(*)
+            FROM ip_inventory
+            WHERE status IS NOT NULL
+            GROUP BY subnet, COALESCE(vrf_vpn, ''), status
+        """)
+        rebuilt_rows = cursor.rowcount
+        bump_shared_generation(cursor)
+        connection.commit()
+        print(f"🔧 Rebuilt subnet counters ({rebuilt_rows:,} rows)")
+        cursor.close()
+        bump_data_generation()
+        if _prefix_index is not None:
+            load_prefix_index()
+        publish_reset('counters_rebuilt')
+        return True
+    except Error as e:
+        connection.rollback()
+        print(f"❌ Error rebuilding subnet counters: {e}")
+        return False
+    finally:
+        if own_connection:
+            connection.close()
+
 def init_database():
     """Initialize database and tables"""
     try:
@@ -59,6 +758,8 @@ def init_database():
                     vrf_vpn VARCHAR(50),
                     hostname VARCHAR(100),
                     description TEXT,
+                    ip_int DECIMAL(39,0),
+                    content_hash BIGINT UNSIGNED,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                     INDEX idx_ip_address (ip_address),
@@ -67,6 +768,92 @@ def init_database():
                 )
             ''')
             
+            # Numeric address column (DECIMAL(39,0) fits IPv6) so ordering and
+            # range filters use an index instead of INET_ATON() per row
+            ensure_column(cursor, 'ip_inventory', 'ip_int', 'DECIMAL(39,0) AFTER description')
+            backfill_ip_int(connection, cursor)
+            ensure_index(cursor, 'ip_inventory', 'idx_ip_int', '(ip_int)')
+            ensure_index(cursor, 'ip_inventory', 'idx_status_ip_int', '(status, ip_int)')
+            ensure_index(cursor, 'ip_inventory', 'idx_vrf_ip_int', '(vrf_vpn, ip_int)')
+            ensure_index(cursor, 'ip_inventory', 'idx_hostname', '(hostname)')  # host:core-* prefix searches
+            # Fingerprint of the CSV row an entry was imported from; NULL for manual entries/edits
+            ensure_column(cursor, 'ip_inventory', 'content_hash', 'BIGINT UNSIGNED NULL')
+            
+            # Per-(subnet, vrf, status) counts maintained on every write, so
+            # dashboard aggregates read O(#subnets) rows instead of O(#IPs)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ip_subnet_counters (
+                    subnet VARCHAR(18) NOT NULL,
+                    vrf_vpn VARCHAR(50) NOT NULL DEFAULT '',
+                    status ENUM('used', 'available', 'reserved') NOT NULL,
+                    ip_count INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (subnet, vrf_vpn, status),
+                    INDEX idx_counter_vrf (vrf_vpn)
+                )
+            ''')
+            
+            # Small key/value table shared with other processes (importer, maintenance runs)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ipam_meta (
+                    name VARCHAR(64) PRIMARY KEY,
+                    value BIGINT UNSIGNED NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute(
+                "INSERT IGNORE INTO ipam_meta (name, value) VALUES (%s, 0), (%s, 0)",
+                (CHANGE_SEQ_KEY, CHANGE_FLOOR_KEY)
+            )
+            ensure_fulltext_index(cursor)  # records how it was built in ipam_meta
+            
+            # Append-only feed of ip_inventory changes for incremental consumers (/api/changes)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ip_change_log (
+                    seq BIGINT UNSIGNED PRIMARY KEY,
+                    op ENUM('insert', 'update', 'delete', 'reset') NOT NULL,
+                    ip_address VARCHAR(15),
+                    old_ip_address VARCHAR(15),
+                    row_data JSON,
+                    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_change_time (changed_at)
+                )
+            ''')
+            connection.commit()
+            
+            # Planned / reserved prefixes (child blocks carved by /api/prefix/reserve)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS subnets (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    subnet VARCHAR(43) NOT NULL UNIQUE,
+                    description TEXT,
+                    service_domain VARCHAR(50),
+                    status ENUM('active', 'inactive') DEFAULT 'active',
+                    range_start DECIMAL(39,0),
+                    range_end DECIMAL(39,0),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    INDEX idx_subnet_range (range_start, range_end)
+                )
+            ''')
+            ensure_column(cursor, 'subnets', 'range_start', 'DECIMAL(39,0)')
+            ensure_column(cursor, 'subnets', 'range_end', 'DECIMAL(39,0)')
+            ensure_index(cursor, 'subnets', 'idx_subnet_range', '(range_start, range_end)')
+            cursor.execute("SELECT id, subnet FROM subnets WHERE range_start IS NULL")
+            for row_id, subnet in cursor.fetchall():
+                try:
+                    network = ipaddress.ip_network(subnet, strict=False)
+                except ValueError:
+                    continue
+                cursor.execute(
+                    "UPDATE subnets SET range_start = %s, range_end = %s WHERE id = %s",
+                    (int(network.network_address), int(network.broadcast_address), row_id)
+                )
+            connection.commit()
+            
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM ip_subnet_counters), EXISTS(SELECT 1 FROM ip_inventory)")
+            has_counters, has_ips = cursor.fetchone()
+            if has_ips and not has_counters:
+                rebuild_subnet_counters(connection)
+            
             connection.commit()
             cursor.close()
             connection.close()
@@ -89,7 +876,7 @@ def get_ip_data(limit=100):
                 id, ip_address, subnet, status, vrf_vpn, hostname, 
                 description, created_at, updated_at
             FROM ip_inventory 
-            ORDER BY INET_ATON(ip_address)
+            ORDER BY ip_int
             LIMIT %s
         """
         
@@ -112,87 +899,835 @@ def get_ip_data(limit=100):
         print(f"❌ Error getting IP data: {e}")
         return []
 
-def get_real_statistics():
-    """Get real IP statistics with calculated available IPs from subnet sizes"""
+def encode_page_cursor(ip_int, direction):
+    """Build opaque pagination cursor continuing 'after' or 'before' an ip_int"""
+    raw = json.dumps({'k': str(ip_int), 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_page_cursor(token):
+    """Decode pagination cursor into (ip_int, direction) - raises ValueError if malformed"""
     try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        direction = data['d']
+        ip_int = int(data['k'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if direction not in ('after', 'before'):
+        raise ValueError(f"Invalid cursor direction: {direction}")
+    return ip_int, direction
+
+def fetch_ip_page(cursor, columns, where_conditions, params, limit, page=1, cursor_token=''):
+    """Fetch one page of ip_inventory rows in ip_int order
+    
+    With a cursor the page continues from the cursor position using the ip_int
+    index (no OFFSET scan); otherwise the page number is used. Returns
+    (rows, next_cursor, prev_cursor).
+    """
+    conditions = list(where_conditions)
+    query_params = list(params)
+    direction = None
+    
+    if cursor_token:
+        position, direction = decode_page_cursor(cursor_token)
+        conditions.append("ip_int > %s" if direction == 'after' else "ip_int < %s")
+        query_params.append(position)
+    
+    where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+    order = "DESC" if direction == 'before' else "ASC"
+    query = f"""
+        SELECT {columns}, ip_int
+        FROM ip_inventory
+        {where_clause}
+        ORDER BY ip_int {order}
+        LIMIT %s
+    """
+    # Fetch one extra row to know whether another page exists in this direction
+    query_params.append(limit + 1)
+    if direction is None:
+        query += " OFFSET %s"
+        query_params.append(max(page - 1, 0) * limit)
+    
+    cursor.execute(query, query_params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'before':
+        rows.reverse()
+    
+    next_cursor = None
+    prev_cursor = None
+    if rows:
+        first_key = rows[0]['ip_int']
+        last_key = rows[-1]['ip_int']
+        if direction == 'before':
+            next_cursor = encode_page_cursor(last_key, 'after')
+            prev_cursor = encode_page_cursor(first_key, 'before') if has_more else None
+        else:
+            next_cursor = encode_page_cursor(last_key, 'after') if has_more else None
+            if direction == 'after' or page > 1:
+                prev_cursor = encode_page_cursor(first_key, 'before')
+    
+    for row in rows:
+        del row['ip_int']
+    
+    return rows, next_cursor, prev_cursor
+
+# Search Configuration
+SEARCH_MODES = ('auto', 'substring', 'fulltext', 'ranked')
+FULLTEXT_INDEX = 'ft_hostname_description'
+FULLTEXT_STOPWORDS_OFF_KEY = 'fulltext_stopwords_off'  # ipam_meta marker: index built without stopwords
+IP_PREFIX_PATTERN = re.compile(r'^\d{1,3}(\.\d{0,3}){1,3}$')  # '10.', '10.20.3', ...
+
+_fulltext_available = None  # None until checked against information_schema
+_fulltext_min_term = 2  # the server's ngram_token_size - shorter terms are not in the index
+
+def load_ngram_token_size(cursor):
+    global _fulltext_min_term
+    cursor.execute("SELECT @@ngram_token_size")
+    _fulltext_min_term = int(cursor.fetchone()[0])
+
+def ensure_fulltext_index(cursor):
+    """Add the ngram FULLTEXT index on (hostname, description) if the server supports it
+    
+    The index is built with innodb_ft_enable_stopword off: the ngram parser
+    drops every token containing a stopword, and the default list has
+    single letters like 'a' and 'i', so most hostname fragments would never
+    match. An index built before that (no ipam_meta marker) is rebuilt once.
+    """
+    global _fulltext_available
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ip_inventory' AND INDEX_NAME = %s
+    """, (FULLTEXT_INDEX,))
+    exists = cursor.fetchone()[0] > 0
+    cursor.execute("SELECT value FROM ipam_meta WHERE name = %s", (FULLTEXT_STOPWORDS_OFF_KEY,))
+    built_without_stopwords = cursor.fetchone() is not None
+    if not (exists and built_without_stopwords):
+        try:
+            cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+            if exists:
+                print(f"🔧 Rebuilding index ip_inventory.{FULLTEXT_INDEX} without stopwords...")
+                cursor.execute(f"ALTER TABLE ip_inventory DROP INDEX {FULLTEXT_INDEX}")
+            cursor.execute(f"ALTER TABLE ip_inventory ADD FULLTEXT INDEX {FULLTEXT_INDEX} (hostname, description) WITH PARSER ngram")
+            cursor.execute("INSERT IGNORE INTO ipam_meta (name, value) VALUES (%s, 1)", (FULLTEXT_STOPWORDS_OFF_KEY,))
+            print(f"🔧 Added index ip_inventory.{FULLTEXT_INDEX}")
+        except Error as e:
+            # e.g. MariaDB has no ngram parser - search keeps using LIKE
+            print(f"⚠️ Full-text search index unavailable, using substring search: {e}")
+            _fulltext_available = False
+            return False
+        finally:
+            cursor.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+    load_ngram_token_size(cursor)
+    _fulltext_available = True
+    return True
+
+def fulltext_search_available():
+    """Whether the FULLTEXT index exists (checked once per process)"""
+    global _fulltext_available
+    if _fulltext_available is None:
         connection = get_db_connection()
         if not connection:
-            return {}
-            
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get all subnets and their usage
-        cursor.execute("""
-            SELECT 
-                subnet,
-                COUNT(*) as total_records,
-                SUM(CASE WHEN status = 'used' THEN 1 ELSE 0 END) as used_count,
-                SUM(CASE WHEN status = 'reserved' THEN 1 ELSE 0 END) as reserved_count
-            FROM ip_inventory 
-            WHERE subnet IS NOT NULL AND subnet != ''
-            GROUP BY subnet
-        """)
+            return False
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ip_inventory' AND INDEX_NAME = %s
+            """, (FULLTEXT_INDEX,))
+            _fulltext_available = cursor.fetchone()[0] > 0
+            if _fulltext_available:
+                load_ngram_token_size(cursor)
+            cursor.close()
+        finally:
+            connection.close()
+    return _fulltext_available
+
+def resolve_search_mode(search, mode='auto'):
+    """Pick the search strategy actually used for a search term
+    
+    Returns 'ip_prefix' (left-anchored LIKE on ip_address), 'fulltext',
+    'ranked', 'substring' (the original LIKE '%term%' scan) or None when
+    there is nothing to search for.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"search_mode must be one of: {', '.join(SEARCH_MODES)}")
+    if not search:
+        return None
+    if mode == 'substring':
+        return 'substring'
+    if mode == 'auto' and IP_PREFIX_PATTERN.match(search):
+        return 'ip_prefix'
+    words = search.replace('"', ' ').split()
+    if not words or not fulltext_search_available() or min(len(word) for word in words) < _fulltext_min_term:
+        return 'substring'
+    return 'fulltext' if mode in ('auto', 'fulltext') else 'ranked'
+
+def fulltext_query(search):
+    """Boolean-mode query requiring every word as an ngram phrase (substring-like matching)"""
+    return ' '.join(f'+"{word}"' for word in search.replace('"', ' ').split())
+
+def search_condition(search, mode):
+    """WHERE condition and params for a search term under a resolved search mode"""
+    if mode == 'ip_prefix':
+        return "ip_address LIKE %s", [search + '%']
+    if mode in ('fulltext', 'ranked'):
+        return "MATCH(hostname, description) AGAINST (%s IN BOOLEAN MODE)", [fulltext_query(search)]
+    search_param = f"%{search}%"
+    return "(ip_address LIKE %s OR hostname LIKE %s OR description LIKE %s)", [search_param, search_param, search_param]
+
+def search_relevance(args):
+    """(expression, params) ranking rows for search_mode=ranked, or None when results keep ip_int order"""
+    _, _, free_text = parse_search_query(args.get('search', '').strip())
+    if resolve_search_mode(free_text, args.get('search_mode', 'auto')) != 'ranked':
+        return None
+    return "MATCH(hostname, description) AGAINST (%s IN BOOLEAN MODE)", [fulltext_query(free_text)]
+
+IP_STATUSES = ('used', 'available', 'reserved')
+SEARCH_KEYS = {'status': 'status', 'vrf': 'vrf_vpn', 'host': 'hostname', 'hostname': 'hostname', 'subnet': 'subnet'}
+WILDCARD_OCTETS_PATTERN = re.compile(r'^(\d{1,3}\.){1,3}\*(\.\*){0,2}$')
+
+def parse_address_term(term):
+    """Inclusive (first, last) ip_int range for an IP, CIDR, a-b range or trailing-wildcard term, else None"""
+    try:
+        if '/' in term:
+            network = ipaddress.ip_network(term, strict=False)
+            return int(network.network_address), int(network.broadcast_address)
+        if '-' in term:
+            start, end = (int(ipaddress.ip_address(part.strip())) for part in term.split('-', 1))
+            return (start, end) if start <= end else (end, start)
+        if '*' in term:
+            if not WILDCARD_OCTETS_PATTERN.match(term) or term.count('.') > 3:
+                return None
+            fixed = [int(octet) for octet in term.split('.') if octet != '*']
+            if any(octet > 255 for octet in fixed):
+                return None
+            free_bits = 8 * (4 - len(fixed))
+            first = int.from_bytes(bytes(fixed + [0] * (4 - len(fixed))), 'big')
+            return first, first + (1 << free_bits) - 1
+        address = int(ipaddress.ip_address(term))
+        return address, address
+    except ValueError:
+        return None
+
+def like_pattern(value):
+    """LIKE pattern for a value where '*' is the only wildcard"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace('*', '%')
+
+def parse_search_query(search):
+    """Compile a search box query into indexed predicates
+    
+    IPs, CIDRs (10.1.0.0/16), ranges (10.1.2.10-10.1.2.200) and trailing
+    wildcard octets (10.1.*) become ip_int ranges; status:, vrf:, host: and
+    subnet: terms become equality (or prefix LIKE with a trailing '*')
+    predicates. Terms on the same field are OR'ed, different fields AND'ed.
+    Returns (where_conditions, params, free_text) where free_text is whatever
+    is left for the text search. Raises ValueError for an unknown status.
+    """
+    ranges = []
+    key_terms = {}
+    free_words = []
+    
+    for term in search.split():
+        key, sep, value = term.partition(':')
+        column = SEARCH_KEYS.get(key.lower()) if sep else None
+        if column and value:
+            if column == 'status' and value.lower() not in IP_STATUSES:
+                raise ValueError(f"status must be one of: {', '.join(IP_STATUSES)}")
+            key_terms.setdefault(column, []).append(value.lower() if column == 'status' else value)
+            continue
+        address_range = parse_address_term(term)
+        if address_range:
+            ranges.append(address_range)
+        else:
+            free_words.append(term)
+    
+    where_conditions = []
+    params = []
+    if ranges:
+        predicates = []
+        for first, last in ranges:
+            if first == last:
+                predicates.append("ip_int = %s")
+                params.append(first)
+            else:
+                predicates.append("ip_int BETWEEN %s AND %s")
+                params.extend([first, last])
+        where_conditions.append("(" + " OR ".join(predicates) + ")")
+    
+    for column, values in key_terms.items():
+        predicates = []
+        for value in values:
+            if '*' in value:
+                predicates.append(f"{column} LIKE %s")
+                params.append(like_pattern(value))
+            else:
+                predicates.append(f"{column} = %s")
+                params.append(value)
+        where_conditions.append("(" + " OR ".join(predicates) + ")")
+    
+    return where_conditions, params, ' '.join(free_words)
+
+def effective_search_mode(args):
+    """Text search strategy used for a request's search box (see resolve_search_mode)"""
+    _, _, free_text = parse_search_query(args.get('search', '').strip())
+    return resolve_search_mode(free_text, args.get('search_mode', 'auto'))
+
+def search_filters(args):
+    """WHERE conditions for the search box: parsed address/key terms plus text search on the rest"""
+    where_conditions, params, free_text = parse_search_query(args.get('search', '').strip())
+    search_mode = resolve_search_mode(free_text, args.get('search_mode', 'auto'))
+    if search_mode:
+        condition, search_params = search_condition(free_text, search_mode)
+        where_conditions.append(condition)
+        params.extend(search_params)
+    return where_conditions, params
+
+def fetch_ranked_ip_page(cursor, columns, where_conditions, params, relevance, limit, page=1):
+    """Fetch one page of ip_inventory rows, best search matches first (page numbers only)"""
+    relevance_expr, relevance_params = relevance
+    where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    cursor.execute(f"""
+        SELECT {columns}, {relevance_expr} AS relevance
+        FROM ip_inventory
+        {where_clause}
+        ORDER BY relevance DESC, ip_int
+        LIMIT %s OFFSET %s
+    """, relevance_params + list(params) + [limit, max(page - 1, 0) * limit])
+    rows = cursor.fetchall()
+    for row in rows:
+        row['relevance'] = round(float(row['relevance']), 4)
+    return rows
+
+def build_ip_data_filters(args):
+    """WHERE conditions for /api/ip-data (exact status and VRF match)"""
+    where_conditions, params = search_filters(args)
+    status_filter = args.get('status', '').strip()
+    vrf_vpn_filter = args.get('vrf_vpn', '').strip()
+    
+    if status_filter:
+        where_conditions.append("status = %s")
+        params.append(status_filter)
         
-        subnet_data = cursor.fetchall()
+    if vrf_vpn_filter:
+        where_conditions.append("vrf_vpn = %s")
+        params.append(vrf_vpn_filter)
+    
+    return where_conditions, params
+
+def build_ip_list_filters(args):
+    """WHERE conditions for /api/ip-list (substring subnet and VRF match)"""
+    where_conditions, params = search_filters(args)
+    status_filter = args.get('status', '').strip()
+    subnet_filter = args.get('subnet', '').strip()
+    vrf_filter = args.get('vrf', '').strip()
+    
+    if status_filter and status_filter != 'all':
+        where_conditions.append("status = %s")
+        params.append(status_filter)
         
-        total_subnet_space = 0
-        total_used = 0
-        total_reserved = 0
-        total_real_available = 0
+    if subnet_filter:
+        where_conditions.append("subnet LIKE %s")
+        params.append(f"%{subnet_filter}%")
         
-        for row in subnet_data:
-            subnet = row['subnet']
-            used_count = row['used_count'] or 0
-            reserved_count = row['reserved_count'] or 0
-            
-            try:
-                # Calculate actual subnet size
-                network = ipaddress.ip_network(subnet, strict=False)
-                
-                # For /31 and /32, use special handling
-                if network.prefixlen >= 31:
-                    subnet_size = network.num_addresses
-                else:
-                    subnet_size = network.num_addresses - 2  # Exclude network and broadcast
-                
-                if subnet_size <= 0:
-                    continue
-                
-                real_available = subnet_size - used_count - reserved_count
-                
-                total_subnet_space += subnet_size
-                total_used += used_count
-                total_reserved += reserved_count
-                total_real_available += real_available
-                    
-            except Exception as e:
-                print(f"Error processing subnet {subnet}: {e}")
-                continue
+    if vrf_filter:
+        where_conditions.append("vrf_vpn LIKE %s")
+        params.append(f"%{vrf_filter}%")
+    
+    return where_conditions, params
+
+# Data generation - bumped after every committed write so caches can tell stale entries apart
+_data_generation = 0
+_data_generation_lock = threading.Lock()
+
+def current_data_generation():
+    """Current data generation number"""
+    return _data_generation
+
+def bump_data_generation():
+    """Mark all cached results derived from ip_inventory as stale"""
+    global _data_generation
+    with _data_generation_lock:
+        _data_generation += 1
+        return _data_generation
+
+# Shared generation - ipam_meta row bumped by writers outside this process
+# (CSV importer, --rebuild-counters) and polled by the server
+SHARED_GENERATION_KEY = 'data_generation'
+GENERATION_POLL_INTERVAL = float(os.environ.get('IPAM_GENERATION_POLL_INTERVAL', 5))
+
+_shared_generation = None
+_generation_poller = None
+
+def bump_shared_generation(cursor):
+    """Bump the shared generation inside the caller's transaction"""
+    cursor.execute("""
+        INSERT INTO ipam_meta (name, value) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE value = value + 1
+    """, (SHARED_GENERATION_KEY,))
+
+def check_shared_generation():
+    """Invalidate in-process state if another process changed the data since the last check"""
+    global _shared_generation
+    connection = get_db_connection()
+    if not connection:
+        return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT value FROM ipam_meta WHERE name = %s", (SHARED_GENERATION_KEY,))
+        row = cursor.fetchone()
+        cursor.close()
+    except Error as e:
+        print(f"❌ Error reading shared generation: {e}")
+        return False
+    finally:
+        connection.close()
+    
+    value = row[0] if row else 0
+    changed = _shared_generation is not None and value != _shared_generation
+    _shared_generation = value
+    if changed:
+        print(f"🔄 Data changed outside this process (generation {value}) - reloading caches")
+        bump_data_generation()
+        drop_allocation_bitmaps()
+        if _prefix_index is not None:
+            load_prefix_index()
+        publish_reset('external_change')
+    return changed
+
+def _poll_shared_generation():
+    last_compaction = time.monotonic()
+    while True:
+        time.sleep(GENERATION_POLL_INTERVAL)
+        check_shared_generation()
+        if time.monotonic() - last_compaction >= CHANGE_LOG_CONFIG['compact_interval']:
+            last_compaction = time.monotonic()
+            compact_change_log()
+
+def start_generation_poller():
+    """Start the background thread that picks up imports made by other processes"""
+    global _generation_poller
+    if _generation_poller is None:
+        check_shared_generation()
+        _generation_poller = threading.Thread(target=_poll_shared_generation, name='ipam-generation-poller', daemon=True)
+        _generation_poller.start()
+    return _generation_poller
+
+# Count Cache Configuration
+COUNT_CACHE_CONFIG = {
+    'ttl': float(os.environ.get('IPAM_COUNT_CACHE_TTL', 60)),  # bounds staleness when the generation poller is not running
+    'max_entries': int(os.environ.get('IPAM_COUNT_CACHE_SIZE', 1000))
+}
+
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+class CountCache:
+    """Exact COUNT(*) results keyed by filter set, dropped on the next write or after ttl"""
+
+    def __init__(self, ttl=60.0, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (generation, stored_at, total)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        generation, stored_at, total = entry
+        if generation != current_data_generation() or time.monotonic() - stored_at > self.ttl:
+            return None
+        return total
+
+    def put(self, key, generation, total):
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                # Oldest insertion first
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (generation, time.monotonic(), total)
+
+_count_cache = CountCache(**COUNT_CACHE_CONFIG)
+
+# Response Cache Configuration
+RESPONSE_CACHE_CONFIG = {
+    'ttl': float(os.environ.get('IPAM_RESPONSE_CACHE_TTL', 300)),
+    'max_entries': int(os.environ.get('IPAM_RESPONSE_CACHE_SIZE', 256)),
+    'max_stale': float(os.environ.get('IPAM_RESPONSE_CACHE_MAX_STALE', 600))  # oldest entry served while refreshing
+}
+
+class _FlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run one computation per key at a time - concurrent callers wait for and share its result"""
+
+    def __init__(self):
+        self._calls = {}  # key -> _FlightCall
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _FlightCall()
+            else:
+                self.shared += 1
         
-        # Get assigned but available IPs from database
-        cursor.execute("SELECT COUNT(*) as count FROM ip_inventory WHERE status = 'available'")
-        assigned_available_result = cursor.fetchone()
-        assigned_available = assigned_available_result['count'] if assigned_available_result else 0
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
         
-        # Adjust truly free IPs
-        truly_free = total_real_available - assigned_available
-        cursor.execute("SELECT COUNT(DISTINCT subnet) as count FROM ip_inventory WHERE subnet IS NOT NULL")
-        subnet_result = cursor.fetchone()
-        total_subnets = subnet_result['count'] if subnet_result else 0
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.executions += 1
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'executions': self.executions, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+class ResponseCache:
+    """JSON response bodies keyed by endpoint and query args, LRU-bounded
+    
+    Entries are fresh for the data generation they were computed under and
+    at most ttl seconds. An entry that outlived its ttl or a data change may
+    still be served as stale (up to max_stale seconds old) while one
+    background refresh runs, unless the caller asks for a newer generation
+    than the one it was computed under.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=256, max_stale=600.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._entries = OrderedDict()  # key -> (generation, stored_at, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key, min_generation=0):
+        """Return (body, is_fresh, generation); body is None on a miss
         
+        Entries computed under a generation below min_generation are misses.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, stored_at, body = entry
+                age = time.monotonic() - stored_at
+                if age > self.max_stale:
+                    del self._entries[key]
+                elif generation >= min_generation:
+                    self._entries.move_to_end(key)
+                    if generation == current_data_generation() and age <= self.ttl:
+                        self.hits += 1
+                        return body, True, generation
+                    self.stale_hits += 1
+                    return body, False, generation
+            self.misses += 1
+            return None, False, None
+
+    def put(self, key, generation, body):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic(), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'max_stale': self.max_stale,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.stale_hits) / lookups, 4) if lookups else None
+            }
+
+_response_cache = ResponseCache(**RESPONSE_CACHE_CONFIG)
+_response_flight = SingleFlight()
+_count_flight = SingleFlight()
+
+def response_cache_key():
+    """Cache key for the current request: endpoint plus sorted query args"""
+    return (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+
+# Sent by the UI on reloads triggered by a change event, with the event's generation
+GENERATION_HEADER = 'X-IPAM-Generation'
+
+def required_generation():
+    """Oldest data generation the current request accepts from the response cache
+    
+    A reload after a change event names the event's generation; a conditional
+    request whose If-None-Match already holds the body of generation N needs N + 1.
+    Plain polls accept whatever is cached.
+    """
+    required = request.headers.get(GENERATION_HEADER, 0, type=int)
+    for tag in request.if_none_match.as_set(include_weak=True):
+        generation = tag.rpartition('-')[0].rpartition('-')[2]
+        if generation.isdigit() and tag == generation_etag(int(generation)):
+            required = max(required, int(generation) + 1)
+    return required
+
+def _compute_response(key, view, args, kwargs):
+    """Run a view and store its body
+    
+    Returns (body, status, mimetype, generation) so waiters can rebuild the
+    response and tag it with the generation the body was computed under.
+    """
+    # Generation taken before computing, so a concurrent write leaves the entry stale
+    generation = current_data_generation()
+    response = app.make_response(view(*args, **kwargs))
+    body = response.get_data()
+    if response.status_code == 200 and response.is_json:
+        _response_cache.put(key, generation, body)
+    return body, response.status_code, response.mimetype, generation
+
+def _refresh_response(key, view, args, kwargs, path, query_string):
+    # Runs outside the caller's request, so give the view a request context of its own
+    try:
+        with app.test_request_context(path, query_string=query_string):
+            _response_flight.do(key, lambda: _compute_response(key, view, args, kwargs))
+    except Exception as e:
+        print(f"❌ Background refresh of {path} failed: {e}")
+
+def cached_json(view):
+    """Serve a read-only JSON view from the response cache (only 200 responses are stored)
+    
+    Identical concurrent misses share one execution of the view; an entry
+    past its ttl or computed before the latest write is returned immediately
+    while a single background refresh runs. Callers that need a newer
+    generation (see required_generation) wait for, or join, that refresh.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = response_cache_key()
+        body, is_fresh, generation = _response_cache.lookup(key, required_generation())
+        if body is not None:
+            if not is_fresh and not _response_flight.in_flight(key):
+                threading.Thread(
+                    target=_refresh_response,
+                    args=(key, view, args, kwargs, request.path, request.query_string.decode()),
+                    daemon=True
+                ).start()
+            status, mimetype = 200, 'application/json'
+        else:
+            body, status, mimetype, generation = _response_flight.do(key, lambda: _compute_response(key, view, args, kwargs))
+        if 'etag_generation' in g:
+            # A stale entry or joined computation may predate this request's
+            # generation - tag the body with the one it was actually computed under
+            g.etag_generation = min(g.etag_generation, generation)
+        return app.response_class(body, status=status, mimetype=mimetype)
+    return wrapper
+
+def count_ip_rows(cursor, where_conditions, params, mode='exact'):
+    """Count ip_inventory rows matching the filters
+    
+    mode 'exact' runs (or reuses a cached) COUNT(*), 'estimate' answers from
+    optimizer statistics without scanning, 'none' skips counting.
+    Returns (total, is_estimate).
+    """
+    if mode == 'none':
+        return None, False
+    
+    where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    key = (where_clause, tuple(params))
+    cached = _count_cache.get(key)
+    if cached is not None:
+        return cached, False
+    
+    if mode == 'estimate':
+        if where_conditions:
+            cursor.execute(f"EXPLAIN SELECT id FROM ip_inventory {where_clause}", params)
+            plan = cursor.fetchall()
+            row = plan[0] if plan else {}
+            estimate = (row.get('rows') or 0) * float(row.get('filtered') or 100) / 100
+        else:
+            cursor.execute("""
+                SELECT TABLE_ROWS as estimate FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ip_inventory'
+            """)
+            row = cursor.fetchone()
+            estimate = row['estimate'] if row and row['estimate'] else 0
+        return int(estimate), True
+    
+    def count_exact():
+        generation = current_data_generation()
+        cursor.execute(f"SELECT COUNT(*) as total FROM ip_inventory {where_clause}", params)
+        result = cursor.fetchone()
+        total = result['total'] if result else 0
+        _count_cache.put(key, generation, total)
+        return total
+    
+    # Identical filter sets counted concurrently share one COUNT(*)
+    return _count_flight.do(key, count_exact), False
+
+def fetch_counter_rows(cursor):
+    """All ip_subnet_counters rows - the single input for the dashboard rollups below"""
+    cursor.execute("SELECT subnet, vrf_vpn, status, ip_count FROM ip_subnet_counters")
+    return cursor.fetchall()
+
+def usable_hosts(network):
+    """Assignable addresses in a subnet (network and broadcast excluded below /31)"""
+    return network.num_addresses if network.prefixlen >= 31 else network.num_addresses - 2
+
+def rollup_by_subnet(counter_rows):
+    """{subnet: {'used': n, 'reserved': n, 'available': n}} from counter rows"""
+    subnets = {}
+    for row in counter_rows:
+        counts = subnets.setdefault(row['subnet'], {'used': 0, 'reserved': 0, 'available': 0})
+        counts[row['status']] += int(row['ip_count'] or 0)
+    return subnets
+
+def rollup_statistics(counter_rows):
+    """Overall statistics with available IPs calculated from subnet sizes"""
+    subnet_counts = rollup_by_subnet(counter_rows)
+    
+    total_subnet_space = 0
+    total_used = 0
+    total_reserved = 0
+    total_real_available = 0
+    
+    # IPs that are assigned but still marked available
+    assigned_available = sum(counts['available'] for counts in subnet_counts.values())
+    
+    for subnet, counts in subnet_counts.items():
+        if not subnet:
+            continue
+        try:
+            subnet_size = usable_hosts(ipaddress.ip_network(subnet, strict=False))
+        except ValueError as e:
+            print(f"Error processing subnet {subnet}: {e}")
+            continue
+        if subnet_size <= 0:
+            continue
+        
+        total_subnet_space += subnet_size
+        total_used += counts['used']
+        total_reserved += counts['reserved']
+        total_real_available += subnet_size - counts['used'] - counts['reserved']
+    
+    return {
+        'total_ips': total_subnet_space,
+        'used_ips': total_used,
+        'reserved_ips': total_reserved,
+        'available_ips': total_real_available,
+        'assigned_available': assigned_available,  # IP ที่ถูก assign แต่ยัง available
+        'truly_free': total_real_available - assigned_available,  # IP ที่ว่างจริงๆ
+        'total_subnets': len(subnet_counts),
+        'utilization_percent': round((total_used / total_subnet_space * 100), 2) if total_subnet_space > 0 else 0
+    }
+
+def rollup_pie_chart(stats):
+    """Pie chart slices for IP usage"""
+    return [
+        {"name": "Used IPs", "value": stats.get('used_ips', 0), "color": "#ff6b6b"},
+        {"name": "Reserved IPs", "value": stats.get('reserved_ips', 0), "color": "#ffa726"},
+        {"name": "Assigned Available", "value": stats.get('assigned_available', 0), "color": "#66bb6a"},
+        {"name": "Truly Free", "value": stats.get('truly_free', 0), "color": "#42a5f5"}
+    ]
+
+def rollup_top_subnets(counter_rows, limit=10):
+    """Most used subnets with their utilization"""
+    used_by_subnet = [
+        (subnet, counts['used']) for subnet, counts in rollup_by_subnet(counter_rows).items()
+        if subnet and counts['used'] > 0
+    ]
+    used_by_subnet.sort(key=lambda item: item[1], reverse=True)
+    
+    top_subnets = []
+    for subnet, used_count in used_by_subnet[:limit]:
+        try:
+            subnet_size = usable_hosts(ipaddress.ip_network(subnet, strict=False))
+        except ValueError:
+            continue
+        top_subnets.append({
+            "subnet": subnet,
+            "utilization": round((used_count / subnet_size * 100) if subnet_size > 0 else 0, 2),
+            "used": used_count,
+            "total": subnet_size
+        })
+    return top_subnets
+
+def rollup_vrf_summary(counter_rows):
+    """Per VRF/service domain totals, largest first"""
+    vrfs = {}
+    for row in counter_rows:
+        counts = vrfs.setdefault(row['vrf_vpn'], {'used': 0, 'reserved': 0, 'available': 0})
+        counts[row['status']] += int(row['ip_count'] or 0)
+    
+    totals = sorted(((vrf, sum(counts.values()), counts) for vrf, counts in vrfs.items()), key=lambda item: item[1], reverse=True)
+    total_all_ips = sum(total for _, total, _ in totals)
+    
+    summary = []
+    for vrf, total, counts in totals:
+        utilization = (counts['used'] / total * 100) if total > 0 else 0
+        percentage_of_total = (total / total_all_ips * 100) if total_all_ips > 0 else 0
+        summary.append({
+            'service_domain': vrf or 'Unassigned',
+            'total_ips': total,
+            'used_ips': counts['used'],
+            'available_ips': counts['available'],
+            'reserved_ips': counts['reserved'],
+            'utilization_percent': round(utilization, 2),
+            'percentage_of_total': round(percentage_of_total, 2),
+            'status': 'Critical' if utilization > 90 else 'Warning' if utilization > 70 else 'Good'
+        })
+    
+    return {
+        'summary': summary,
+        'total_domains': len(summary),
+        'total_ips': total_all_ips
+    }
+
+def get_real_statistics():
+    """Get real IP statistics with calculated available IPs from subnet sizes"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return {}
+            
+        cursor = connection.cursor(dictionary=True)
+        counter_rows = fetch_counter_rows(cursor)
         cursor.close()
         connection.close()
         
-        return {
-            'total_ips': total_subnet_space,
-            'used_ips': total_used,
-            'reserved_ips': total_reserved,
-            'available_ips': total_real_available,
-            'assigned_available': assigned_available,  # IP ที่ถูก assign แต่ยัง available
-            'truly_free': truly_free,  # IP ที่ว่างจริงๆ
-            'total_subnets': total_subnets,
-            'utilization_percent': round((total_used / total_subnet_space * 100), 2) if total_subnet_space > 0 else 0
-        }
+        return rollup_statistics(counter_rows)
         
     except Error as e:
         print(f"❌ Error getting real statistics: {e}")
@@ -251,6 +1786,47 @@ def get_statistics():
         print(f"❌ Error getting statistics: {e}")
         return {}
 
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    """Return connections a handler did not close (e.g. after an exception) to the pool"""
+    for connection in g.pop('db_connections', []):
+        connection.close()
+
+# Conditional GET - read APIs are tagged with the data generation they were served under
+ETAG_EXEMPT_ENDPOINTS = {'api_db_pool_status', 'api_cache_stats', 'api_events', 'api_changes'}
+
+def generation_etag(generation):
+    """ETag for the current request's path and args at a data generation (no body hashing)"""
+    digest = hashlib.blake2b(repr(response_cache_key()).encode(), digest_size=8).hexdigest()
+    # Generations restart at 0 with the process, so tags also carry the process marker
+    return f"{_process_instance}-{generation}-{digest}"
+
+@app.before_request
+def answer_not_modified():
+    """Return 304 before the handler runs (and touches the database) when the client copy is current"""
+    if request.method not in ('GET', 'HEAD') or not request.path.startswith('/api/'):
+        return None
+    if request.endpoint is None or request.endpoint in ETAG_EXEMPT_ENDPOINTS:
+        return None
+    
+    # Captured before any query runs, so a write during the request only makes the tag older
+    g.etag_generation = current_data_generation()
+    etag = generation_etag(g.etag_generation)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+@app.after_request
+def add_generation_etag(response):
+    generation = g.pop('etag_generation', None)
+    if generation is not None and response.status_code == 200 and 'ETag' not in response.headers:
+        response.set_etag(generation_etag(generation), weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # Routes
 @app.route('/')
 def index():
@@ -269,16 +1845,22 @@ def advanced_dashboard():
 
 @app.route('/api/ip-data')
 def api_ip_data():
-    """API to get IP data"""
+    """API to get IP data (page number or keyset cursor)"""
     try:
         limit = request.args.get('limit', 100, type=int)
         page = request.args.get('page', 1, type=int)
-        search = request.args.get('search', '')
-        status_filter = request.args.get('status', '')
-        vrf_vpn_filter = request.args.get('vrf_vpn', '')
+        cursor_token = request.args.get('cursor', '')
+        count_mode = request.args.get('count', 'exact')
+        if count_mode not in COUNT_MODES:
+            return jsonify({'error': f"count must be one of: {', '.join(COUNT_MODES)}"}), 400
+        if request.args.get('search_mode', 'auto') not in SEARCH_MODES:
+            return jsonify({'error': f"search_mode must be one of: {', '.join(SEARCH_MODES)}"}), 400
         
-        # Calculate offset
-        offset = (page - 1) * limit
+        # Build query with filters
+        try:
+            where_conditions, params = build_ip_data_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         connection = get_db_connection()
         if not connection:
@@ -286,45 +1868,25 @@ def api_ip_data():
             
         cursor = connection.cursor(dictionary=True)
         
-        # Build query with filters
-        where_conditions = []
-        params = []
-        
-        if search:
-            where_conditions.append("(ip_address LIKE %s OR hostname LIKE %s OR description LIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-            
-        if status_filter:
-            where_conditions.append("status = %s")
-            params.append(status_filter)
-            
-        if vrf_vpn_filter:
-            where_conditions.append("vrf_vpn = %s")
-            params.append(vrf_vpn_filter)
-        
-        where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        columns = "id, ip_address, subnet, status, vrf_vpn, hostname, description, created_at, updated_at"
+        relevance = search_relevance(request.args)
         
         # Get data
-        query = f"""
-            SELECT 
-                id, ip_address, subnet, status, vrf_vpn, hostname, 
-                description, created_at, updated_at
-            FROM ip_inventory 
-            {where_clause}
-            ORDER BY INET_ATON(ip_address)
-            LIMIT %s OFFSET %s
-        """
-        
-        params.extend([limit, offset])
-        cursor.execute(query, params)
-        results = cursor.fetchall()
+        try:
+            if relevance:
+                results = fetch_ranked_ip_page(cursor, columns, where_conditions, params, relevance, limit, page)
+                next_cursor = prev_cursor = None
+            else:
+                results, next_cursor, prev_cursor = fetch_ip_page(
+                    cursor, columns, where_conditions, params, limit, page, cursor_token
+                )
+        except ValueError:
+            cursor.close()
+            connection.close()
+            return jsonify({'error': 'Invalid cursor'}), 400
         
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM ip_inventory {where_clause}"
-        cursor.execute(count_query, params[:-2] if params else [])  # Exclude limit and offset
-        total_result = cursor.fetchone()
-        total_count = total_result['total'] if total_result else 0
+        # Get total count (cached / estimated / skipped depending on count mode)
+        total_count, total_is_estimate = count_ip_rows(cursor, where_conditions, params, count_mode)
         
         # Convert datetime objects to strings
         for row in results:
@@ -339,9 +1901,13 @@ def api_ip_data():
         return jsonify({
             'data': results,
             'total': total_count,
-            'page': page,
+            'total_is_estimate': total_is_estimate,
+            'page': None if cursor_token and not relevance else page,
             'limit': limit,
-            'total_pages': (total_count + limit - 1) // limit
+            'total_pages': (total_count + limit - 1) // limit if total_count is not None else None,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'search_mode': effective_search_mode(request.args)
         })
         
     except Error as e:
@@ -349,6 +1915,7 @@ def api_ip_data():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/statistics')
+@cached_json
 def api_statistics():
     """API to get statistics with real calculated available IPs"""
     print("📊 Getting real statistics...")
@@ -356,16 +1923,144 @@ def api_statistics():
     print(f"📊 Stats calculated: Available IPs = {stats.get('available_ips', 'Unknown')}")
     return jsonify(stats)
 
+@app.route('/api/events')
+def api_events():
+    """API: Server-Sent Events stream of committed changes
+    
+    Events: ip.added / ip.updated / ip.deleted, subnet.counters (counter
+    deltas) and reset (reload everything). Each carries the data generation.
+    Reconnecting clients send Last-Event-ID and get the missed events
+    replayed, or a reset if they are no longer buffered.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '')
+    last_seq = None
+    if last_event_id:
+        instance, _, seq = last_event_id.partition(':')
+        last_seq = int(seq) if instance == _process_instance and seq.isdigit() else -1
+    
+    client, replay, current_seq = _event_broker.subscribe(last_seq)
+    
+    def format_event(event):
+        seq, event_type, payload = event
+        return f"id: {_process_instance}:{seq}\nevent: {event_type}\ndata: {payload}\n\n"
+    
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            if replay is None:
+                reset = json.dumps({'generation': current_data_generation(), 'reason': 'events_lost'})
+                yield f"id: {_process_instance}:{current_seq}\nevent: reset\ndata: {reset}\n\n"
+            else:
+                for event in replay:
+                    yield format_event(event)
+            while not client.lagging:
+                try:
+                    event = client.queue.get(timeout=_event_broker.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            _event_broker.unsubscribe(client)
+    
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/changes')
+def api_changes():
+    """API: Change feed - ip_inventory changes after a sequence number, oldest first
+    
+    Query: since (last seq seen, default 0), limit (default 500, max 5000).
+    An op of 'reset' means the data was replaced wholesale (CSV import) and
+    the consumer must resync. 410 means since is older than the retained
+    log; resync from /api/ip-data and continue from latest_seq.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 0), 5000)
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT name, value FROM ipam_meta WHERE name IN (%s, %s)", (CHANGE_SEQ_KEY, CHANGE_FLOOR_KEY))
+        meta = {row['name']: int(row['value']) for row in cursor.fetchall()}
+        floor = meta.get(CHANGE_FLOOR_KEY, 0)
+        latest_seq = meta.get(CHANGE_SEQ_KEY, 0)
+        if since < floor:
+            cursor.close()
+            connection.close()
+            return jsonify({
+                'error': f'Changes up to seq {floor} have been compacted - resync and continue from latest_seq',
+                'oldest_available': floor + 1,
+                'latest_seq': latest_seq
+            }), 410
+        
+        cursor.execute("""
+            SELECT seq, op, ip_address, old_ip_address, row_data, changed_at
+            FROM ip_change_log
+            WHERE seq > %s
+            ORDER BY seq
+            LIMIT %s
+        """, (since, limit + 1))
+        changes = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        for change in changes:
+            change['data'] = json.loads(change.pop('row_data')) if change['row_data'] else None
+            if change['changed_at']:
+                change['changed_at'] = change['changed_at'].isoformat()
+        
+        return jsonify({
+            'changes': changes,
+            'next_since': changes[-1]['seq'] if changes else since,
+            'has_more': has_more,
+            'latest_seq': latest_seq
+        })
+        
+    except Error as e:
+        print(f"❌ Error reading change feed: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache-stats')
+def api_cache_stats():
+    """API to get response cache hit/miss counts and the current data generation"""
+    return jsonify({
+        'response_cache': _response_cache.stats(),
+        'single_flight': _response_flight.stats(),
+        'event_stream': _event_broker.status(),
+        'data_generation': current_data_generation(),
+        'shared_generation': _shared_generation
+    })
+
+@app.route('/api/db-pool-status')
+def api_db_pool_status():
+    """API to get connection pool usage for sizing"""
+    return jsonify(get_db_pool().status())
+
 @app.route('/api/ip-list')
 def api_ip_list():
-    """API to get paginated IP list with filtering"""
+    """API to get paginated IP list with filtering (page number or keyset cursor)"""
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
-        search = request.args.get('search', '')
-        status_filter = request.args.get('status', '')
-        subnet_filter = request.args.get('subnet', '')
-        vrf_filter = request.args.get('vrf', '')
+        cursor_token = request.args.get('cursor', '')
+        count_mode = request.args.get('count', 'exact')
+        if count_mode not in COUNT_MODES:
+            return jsonify({'error': f"count must be one of: {', '.join(COUNT_MODES)}"}), 400
+        if request.args.get('search_mode', 'auto') not in SEARCH_MODES:
+            return jsonify({'error': f"search_mode must be one of: {', '.join(SEARCH_MODES)}"}), 400
+        
+        # Build WHERE clause (search box terms compile to indexed predicates)
+        try:
+            where_conditions, params = build_ip_list_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         connection = get_db_connection()
         if not connection:
@@ -373,48 +2068,25 @@ def api_ip_list():
             
         cursor = connection.cursor(dictionary=True)
         
-        # Build WHERE clause
-        where_conditions = []
-        params = []
+        # Get total count (cached / estimated / skipped depending on count mode)
+        total_count, total_is_estimate = count_ip_rows(cursor, where_conditions, params, count_mode)
         
-        if search:
-            where_conditions.append("(ip_address LIKE %s OR hostname LIKE %s OR description LIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-            
-        if status_filter and status_filter != 'all':
-            where_conditions.append("status = %s")
-            params.append(status_filter)
-            
-        if subnet_filter:
-            where_conditions.append("subnet LIKE %s")
-            params.append(f"%{subnet_filter}%")
-            
-        if vrf_filter:
-            where_conditions.append("vrf_vpn LIKE %s")
-            params.append(f"%{vrf_filter}%")
-        
-        where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-        
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM ip_inventory WHERE {where_clause}"
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()['total']
-        
-        # Get paginated results
-        offset = (page - 1) * per_page
-        query = f"""
-            SELECT ip_address, status, vrf_vpn, hostname, description, subnet,
-                   created_at, updated_at
-            FROM ip_inventory 
-            WHERE {where_clause}
-            ORDER BY INET_ATON(ip_address)
-            LIMIT %s OFFSET %s
-        """
-        params.extend([per_page, offset])
-        cursor.execute(query, params)
+        columns = "ip_address, status, vrf_vpn, hostname, description, subnet, created_at, updated_at"
+        relevance = search_relevance(request.args)
         
-        ips = cursor.fetchall()
+        # Get one page of results (ranked search pages by number, not cursor)
+        try:
+            if relevance:
+                ips = fetch_ranked_ip_page(cursor, columns, where_conditions, params, relevance, per_page, page)
+                next_cursor = prev_cursor = None
+            else:
+                ips, next_cursor, prev_cursor = fetch_ip_page(
+                    cursor, columns, where_conditions, params, per_page, page, cursor_token
+                )
+        except ValueError:
+            cursor.close()
+            connection.close()
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         # Format dates
         for ip in ips:
@@ -429,18 +2101,55 @@ def api_ip_list():
         return jsonify({
             'data': ips,
             'pagination': {
-                'page': page,
+                'page': None if cursor_token and not relevance else page,
                 'per_page': per_page,
                 'total': total_count,
-                'pages': (total_count + per_page - 1) // per_page
-            }
+                'total_is_estimate': total_is_estimate,
+                'pages': (total_count + per_page - 1) // per_page if total_count is not None else None
+            },
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'search_mode': effective_search_mode(request.args)
         })
         
     except Error as e:
         print(f"❌ Error getting IP list: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ip-list/count')
+def api_ip_list_count():
+    """API to get the exact total for an /api/ip-list filter set (for lazy loading)"""
+    return _exact_count_response(build_ip_list_filters)
+
+@app.route('/api/ip-data/count')
+def api_ip_data_count():
+    """API to get the exact total for an /api/ip-data filter set (for lazy loading)"""
+    return _exact_count_response(build_ip_data_filters)
+
+def _exact_count_response(build_filters):
+    try:
+        where_conditions, params = build_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = connection.cursor(dictionary=True)
+        total_count, _ = count_ip_rows(cursor, where_conditions, params, 'exact')
+        
+        cursor.close()
+        connection.close()
+        
+        return jsonify({'total': total_count, 'total_is_estimate': False})
+        
+    except Error as e:
+        print(f"❌ Error counting IPs: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/network-tree')
+@cached_json
 def api_network_tree():
     """API to get network tree structure with VRF folders"""
     try:
@@ -455,12 +2164,12 @@ def api_network_tree():
             SELECT 
                 subnet,
                 vrf_vpn,
-                COUNT(*) as total_ips,
-                SUM(CASE WHEN status = 'used' THEN 1 ELSE 0 END) as used_ips,
-                SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available_ips,
-                SUM(CASE WHEN status = 'reserved' THEN 1 ELSE 0 END) as reserved_ips
-            FROM ip_inventory 
-            WHERE subnet IS NOT NULL AND subnet != ''
+                SUM(ip_count) as total_ips,
+                SUM(CASE WHEN status = 'used' THEN ip_count ELSE 0 END) as used_ips,
+                SUM(CASE WHEN status = 'available' THEN ip_count ELSE 0 END) as available_ips,
+                SUM(CASE WHEN status = 'reserved' THEN ip_count ELSE 0 END) as reserved_ips
+            FROM ip_subnet_counters 
+            WHERE subnet != ''
             GROUP BY subnet, vrf_vpn
             ORDER BY INET_ATON(SUBSTRING_INDEX(subnet, '/', 1))
         """)
@@ -482,18 +2191,9 @@ def api_network_tree():
             vrf_vpn = subnet_info['vrf_vpn'] or "Default"
             
             # Determine network type based on IP range
-            ip_part = subnet.split('/')[0]
-            first_octet = int(ip_part.split('.')[0])
-            
-            if first_octet == 10:
-                net_type = "Private_10.x.x.x"
-            elif first_octet == 172:
-                net_type = "Private_172.x.x.x"
-            elif first_octet == 192:
-                net_type = "Private_192.x.x.x"
-            elif first_octet in [1, 5, 6, 9]:
-                net_type = "Public_Networks"
-            else:
+            try:
+                net_type = classify_network_type(subnet)
+            except ValueError:
                 net_type = "Other_Networks"
             
             # Initialize network type if not exists
@@ -524,9 +2224,9 @@ def api_network_tree():
                 else:
                     subnet_size = network.num_addresses - 2
                 
-                used = subnet_info['used_ips'] or 0
-                available_assigned = subnet_info['available_ips'] or 0
-                reserved = subnet_info['reserved_ips'] or 0
+                used = int(subnet_info['used_ips'] or 0)
+                available_assigned = int(subnet_info['available_ips'] or 0)
+                reserved = int(subnet_info['reserved_ips'] or 0)
                 real_available = subnet_size - used - reserved
                 
                 utilization = (used / subnet_size * 100) if subnet_size > 0 else 0
@@ -545,7 +2245,7 @@ def api_network_tree():
                 
                 # Add to VRF group
                 network_types[net_type]["vrf_groups"][vrf_vpn]["children"].append(subnet_node)
-                network_types[net_type]["vrf_groups"][vrf_vpn]["ip_count"] += subnet_info['total_ips']
+                network_types[net_type]["vrf_groups"][vrf_vpn]["ip_count"] += int(subnet_info['total_ips'])
                 
                 # Update network type stats
                 network_types[net_type]["stats"]["total"] += subnet_size
@@ -581,80 +2281,64 @@ def api_network_tree():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/charts-data')
+@cached_json
 def api_charts_data():
     """API to get data for charts"""
     try:
-        stats = get_real_statistics()
-        
-        # Pie chart data for IP usage
-        pie_data = [
-            {"name": "Used IPs", "value": stats.get('used_ips', 0), "color": "#ff6b6b"},
-            {"name": "Reserved IPs", "value": stats.get('reserved_ips', 0), "color": "#ffa726"},
-            {"name": "Assigned Available", "value": stats.get('assigned_available', 0), "color": "#66bb6a"},
-            {"name": "Truly Free", "value": stats.get('truly_free', 0), "color": "#42a5f5"}
-        ]
-        
-        # Get subnet utilization data
         connection = get_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
             
         cursor = connection.cursor(dictionary=True)
+        counter_rows = fetch_counter_rows(cursor)
+        cursor.close()
+        connection.close()
         
-        # Top 10 most utilized subnets
-        cursor.execute("""
-            SELECT 
-                subnet,
-                COUNT(*) as total_records,
-                SUM(CASE WHEN status = 'used' THEN 1 ELSE 0 END) as used_count
-            FROM ip_inventory 
-            WHERE subnet IS NOT NULL AND subnet != ''
-            GROUP BY subnet
-            HAVING used_count > 0
-            ORDER BY used_count DESC
-            LIMIT 10
-        """)
+        stats = rollup_statistics(counter_rows)
+        return jsonify({
+            "pie_chart": rollup_pie_chart(stats),
+            "top_subnets": rollup_top_subnets(counter_rows),
+            "total_stats": stats
+        })
         
-        top_subnets = []
-        subnet_data = cursor.fetchall()
+    except Exception as e:
+        print(f"❌ Error getting charts data: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dashboard')
+@cached_json
+def api_dashboard():
+    """API to get everything the dashboard paints - statistics, pie chart, top subnets, VRF summary
+    
+    One read of ip_subnet_counters, rolled up in Python, instead of one
+    request (and aggregate query) per widget.
+    """
+    try:
+        top = request.args.get('top', 10, type=int)
         
-        for row in subnet_data:
-            subnet = row['subnet']
-            used_count = row['used_count'] or 0
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
             
-            try:
-                import ipaddress
-                network = ipaddress.ip_network(subnet, strict=False)
-                if network.prefixlen >= 31:
-                    subnet_size = network.num_addresses
-                else:
-                    subnet_size = network.num_addresses - 2
-                
-                utilization = (used_count / subnet_size * 100) if subnet_size > 0 else 0
-                
-                top_subnets.append({
-                    "subnet": subnet,
-                    "utilization": round(utilization, 2),
-                    "used": used_count,
-                    "total": subnet_size
-                })
-            except:
-                continue
-        
+        cursor = connection.cursor(dictionary=True)
+        counter_rows = fetch_counter_rows(cursor)
         cursor.close()
         connection.close()
         
+        stats = rollup_statistics(counter_rows)
         return jsonify({
-            "pie_chart": pie_data,
-            "top_subnets": top_subnets,
-            "total_stats": stats
+            'stats': stats,
+            'pie_chart': rollup_pie_chart(stats),
+            'top_subnets': rollup_top_subnets(counter_rows, max(top, 0)),
+            'vrf_summary': rollup_vrf_summary(counter_rows)
         })
         
-    except Exception as e:
-        print(f"❌ Error getting charts data: {e}")
+    except Error as e:
+        print(f"❌ Error getting dashboard data: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/vrf-summary')
+@cached_json
 def api_vrf_summary():
     """API to get VRF/Service Domain summary"""
     try:
@@ -663,60 +2347,18 @@ def api_vrf_summary():
             return jsonify({'error': 'Database connection failed'}), 500
             
         cursor = connection.cursor(dictionary=True)
-        
-        # Get VRF summary with statistics
-        cursor.execute("""
-            SELECT 
-                COALESCE(vrf_vpn, 'Unassigned') as service_domain,
-                COUNT(*) as total_ips,
-                SUM(CASE WHEN status = 'used' THEN 1 ELSE 0 END) as used_ips,
-                SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available_ips,
-                SUM(CASE WHEN status = 'reserved' THEN 1 ELSE 0 END) as reserved_ips
-            FROM ip_inventory
-            GROUP BY vrf_vpn
-            ORDER BY total_ips DESC
-        """)
-        
-        vrf_data = cursor.fetchall()
-        
-        # Calculate percentages and format data
-        total_all_ips = sum(row['total_ips'] for row in vrf_data)
-        
-        summary = []
-        for row in vrf_data:
-            total = row['total_ips']
-            used = row['used_ips']
-            available = row['available_ips']
-            reserved = row['reserved_ips']
-            
-            utilization = (used / total * 100) if total > 0 else 0
-            percentage_of_total = (total / total_all_ips * 100) if total_all_ips > 0 else 0
-            
-            summary.append({
-                'service_domain': row['service_domain'],
-                'total_ips': total,
-                'used_ips': used,
-                'available_ips': available,
-                'reserved_ips': reserved,
-                'utilization_percent': round(utilization, 2),
-                'percentage_of_total': round(percentage_of_total, 2),
-                'status': 'Critical' if utilization > 90 else 'Warning' if utilization > 70 else 'Good'
-            })
-        
+        counter_rows = fetch_counter_rows(cursor)
         cursor.close()
         connection.close()
         
-        return jsonify({
-            'summary': summary,
-            'total_domains': len(vrf_data),
-            'total_ips': total_all_ips
-        })
+        return jsonify(rollup_vrf_summary(counter_rows))
         
     except Error as e:
         print(f"❌ Error getting VRF summary: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/vrf-vpn-list')
+@cached_json
 def api_vrf_vpn_list():
     """API to get list of VRF/VPN"""
     try:
@@ -730,17 +2372,20 @@ def api_vrf_vpn_list():
         cursor.execute("""
             SELECT 
                 vrf_vpn,
-                COUNT(*) as ip_count,
-                SUM(CASE WHEN status = 'used' THEN 1 ELSE 0 END) as used_count,
-                SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available_count,
-                SUM(CASE WHEN status = 'reserved' THEN 1 ELSE 0 END) as reserved_count
-            FROM ip_inventory 
-            WHERE vrf_vpn IS NOT NULL AND vrf_vpn != ''
+                SUM(ip_count) as ip_count,
+                SUM(CASE WHEN status = 'used' THEN ip_count ELSE 0 END) as used_count,
+                SUM(CASE WHEN status = 'available' THEN ip_count ELSE 0 END) as available_count,
+                SUM(CASE WHEN status = 'reserved' THEN ip_count ELSE 0 END) as reserved_count
+            FROM ip_subnet_counters 
+            WHERE vrf_vpn != ''
             GROUP BY vrf_vpn
             ORDER BY ip_count DESC
         """)
         
         vrf_vpn_list = cursor.fetchall()
+        for row in vrf_vpn_list:
+            for field in ('ip_count', 'used_count', 'available_count', 'reserved_count'):
+                row[field] = int(row[field] or 0)
         
         cursor.close()
         connection.close()
@@ -771,7 +2416,7 @@ def api_vrf_vpn_analysis():
                 ip_address, subnet, status, hostname, description, created_at, updated_at
             FROM ip_inventory 
             WHERE vrf_vpn = %s
-            ORDER BY INET_ATON(ip_address)
+            ORDER BY ip_int
         """, (vrf_vpn,))
         
         ips_data = cursor.fetchall()
@@ -827,9 +2472,66 @@ def api_vrf_vpn_analysis():
         print(f"❌ Error analyzing VRF/VPN: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Largest subnet the unpaged expanded view will list host by host
+SUBNET_ANALYSIS_MAX_EXPANDED = 65536
+
+def host_range(network):
+    """First and last usable host address of a network as integers (same rules as network.hosts())"""
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.version == 4 and network.prefixlen < 31:
+        return first + 1, last - 1
+    if network.version == 6 and network.prefixlen < 127:
+        return first + 1, last
+    return first, last
+
+def coalesce_free_ranges(first, last, occupied):
+    """Free [start, end] integer ranges within first..last, given sorted occupied addresses"""
+    ranges = []
+    next_free = first
+    for address in occupied:
+        if address < next_free:
+            continue
+        if address > last:
+            break
+        if address > next_free:
+            ranges.append((next_free, address - 1))
+        next_free = address + 1
+    if next_free <= last:
+        ranges.append((next_free, last))
+    return ranges
+
+def format_subnet_ip(ip_str, ip_info=None):
+    """One ip_list entry for subnet analysis (unrecorded addresses are available)"""
+    if ip_info is None:
+        return {
+            'ip_address': ip_str,
+            'status': 'available',
+            'hostname': '',
+            'description': '',
+            'vrf_vpn': '',
+            'created_at': '',
+            'updated_at': ''
+        }
+    return {
+        'ip_address': ip_str,
+        'status': ip_info['status'],
+        'hostname': ip_info['hostname'] or '',
+        'description': ip_info['description'] or '',
+        'vrf_vpn': ip_info['vrf_vpn'] or '',
+        'created_at': ip_info['created_at'].isoformat() if ip_info['created_at'] else '',
+        'updated_at': ip_info['updated_at'].isoformat() if ip_info['updated_at'] else ''
+    }
+
 @app.route('/api/subnet-analysis')
 def api_subnet_analysis():
-    """API: Analyze subnet utilization"""
+    """API: Analyze subnet utilization
+    
+    view=expanded (default) lists every host address; pass offset/limit to page
+    through it. view=ranges returns only the recorded IPs plus the free space as
+    coalesced [start, end] ranges, so cost follows the number of occupied IPs
+    rather than the subnet size.
+    """
     try:
         subnet = request.args.get('subnet', '').strip()
         if not subnet:
@@ -841,80 +2543,632 @@ def api_subnet_analysis():
         except ValueError:
             return jsonify({'error': 'Invalid subnet format'}), 400
         
+        view = request.args.get('view', 'expanded')
+        if view not in ('expanded', 'ranges'):
+            return jsonify({'error': 'view must be expanded or ranges'}), 400
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', type=int)
+        paged = view == 'expanded' and limit is not None
+        
+        first_host, last_host = host_range(network)
+        total_ips = last_host - first_host + 1
+        
+        if view == 'expanded' and not paged and total_ips > SUBNET_ANALYSIS_MAX_EXPANDED:
+            return jsonify({
+                'error': f'Subnet has {total_ips:,} hosts; use view=ranges or offset/limit paging'
+            }), 400
+        
+        # Host addresses to fetch records for
+        if paged:
+            window_start = first_host + offset
+            window_end = min(last_host, window_start + max(limit, 0) - 1)
+        else:
+            window_start, window_end = first_host, last_host
+        
         connection = get_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
             
         cursor = connection.cursor(dictionary=True)
         
-        # Get all IPs in this subnet from database
-        cursor.execute("""
-            SELECT ip_address, hostname, description, status, vrf_vpn, created_at, updated_at
-            FROM ip_inventory 
-            WHERE subnet = %s OR ip_address LIKE %s
-            ORDER BY INET_ATON(ip_address)
-        """, (subnet, f"{str(network.network_address).rsplit('.', 1)[0]}%"))
+        # Get recorded IPs in this subnet from database (index range scan on ip_int)
+        records = []
+        if window_start <= window_end:
+            cursor.execute("""
+                SELECT ip_address, hostname, description, status, vrf_vpn, created_at, updated_at, ip_int
+                FROM ip_inventory 
+                WHERE ip_int BETWEEN %s AND %s
+                ORDER BY ip_int
+            """, (window_start, window_end))
+            records = cursor.fetchall()
+        
+        if paged:
+            # Utilization covers the whole subnet, not just this page
+            cursor.execute("""
+                SELECT COUNT(*) as used FROM ip_inventory
+                WHERE status IN ('used', 'reserved') AND ip_int BETWEEN %s AND %s
+            """, (first_host, last_host))
+            used_count = cursor.fetchone()['used']
+        else:
+            used_count = sum(1 for row in records if row['status'] in ('used', 'reserved'))
         
-        used_ips = cursor.fetchall()
         cursor.close()
         connection.close()
         
-        # Convert used IPs to dict for quick lookup
-        used_ip_dict = {}
-        for ip_data in used_ips:
-            used_ip_dict[ip_data['ip_address']] = ip_data
-        
-        # Generate all possible IPs in subnet
-        all_ips = []
-        for ip in network.hosts():
-            ip_str = str(ip)
-            if ip_str in used_ip_dict:
-                # IP is used
-                ip_info = used_ip_dict[ip_str]
-                all_ips.append({
-                    'ip_address': ip_str,
-                    'status': ip_info['status'],
-                    'hostname': ip_info['hostname'] or '',
-                    'description': ip_info['description'] or '',
-                    'vrf_vpn': ip_info['vrf_vpn'] or '',
-                    'created_at': ip_info['created_at'].isoformat() if ip_info['created_at'] else '',
-                    'updated_at': ip_info['updated_at'].isoformat() if ip_info['updated_at'] else ''
-                })
-            else:
-                # IP is available
-                all_ips.append({
-                    'ip_address': ip_str,
-                    'status': 'available',
-                    'hostname': '',
-                    'description': '',
-                    'vrf_vpn': '',
-                    'created_at': '',
-                    'updated_at': ''
-                })
-        
-        # Calculate statistics
-        total_ips = len(list(network.hosts()))
-        used_count = len([ip for ip in all_ips if ip['status'] in ['used', 'reserved']])
         available_count = total_ips - used_count
         utilization = (used_count / total_ips * 100) if total_ips > 0 else 0
         
+        # Where this subnet sits among the known prefixes
+        prefix_index = get_prefix_index()
+        parents = [net for net, _ in prefix_index.covering(network) if net != network]
+        child_prefixes = [
+            {'prefix': str(net), 'ip_count': count}
+            for net, count in prefix_index.children(network)
+        ]
+        
         result = {
             'subnet': subnet,
+            'view': view,
+            'parent_prefix': str(parents[-1]) if parents else None,
+            'child_prefixes': child_prefixes,
             'network_address': str(network.network_address),
             'broadcast_address': str(network.broadcast_address),
             'subnet_mask': str(network.netmask),
             'total_ips': total_ips,
             'used_ips': used_count,
             'available_ips': available_count,
-            'utilization_percent': round(utilization, 2),
-            'ip_list': all_ips
+            'utilization_percent': round(utilization, 2)
         }
         
+        address_class = type(network.network_address)
+        
+        if view == 'ranges':
+            occupied = [int(row['ip_int']) for row in records if row['status'] in ('used', 'reserved')]
+            free_ranges = coalesce_free_ranges(first_host, last_host, occupied)
+            result['records'] = [format_subnet_ip(row['ip_address'], row) for row in records]
+            result['free_ranges'] = [
+                [str(address_class(start)), str(address_class(end))] for start, end in free_ranges
+            ]
+            result['free_range_count'] = len(free_ranges)
+        else:
+            # Merge the sorted records into the host sequence of this window
+            records_by_int = {int(row['ip_int']): row for row in records}
+            result['ip_list'] = [
+                format_subnet_ip(str(address_class(address)), records_by_int.get(address))
+                for address in range(window_start, window_end + 1)
+            ]
+            if paged:
+                result['offset'] = offset
+                result['limit'] = limit
+                result['has_more'] = window_end < last_host
+        
         return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/prefix/lookup')
+def api_prefix_lookup():
+    """API: Longest-prefix match and covering/covered subnets for an IP or CIDR"""
+    query = request.args.get('ip', '').strip()
+    if not query:
+        return jsonify({'error': 'ip parameter is required'}), 400
+    
+    try:
+        network = ipaddress.ip_network(query, strict=False)
+    except ValueError:
+        return jsonify({'error': 'Invalid IP address or CIDR'}), 400
+    
+    prefix_index = get_prefix_index()
+    covering = prefix_index.covering(network)
+    is_cidr = '/' in query
+    
+    # Children of the queried block, or of the best match for a single address
+    if is_cidr:
+        parent = network
+    else:
+        parent = covering[-1][0] if covering else None
+    
+    def describe(entries):
+        return [{'prefix': str(net), 'ip_count': count} for net, count in entries]
+    
+    return jsonify({
+        'query': query,
+        'longest_match': describe(covering[-1:])[0] if covering else None,
+        'covering': describe(covering),
+        'covered': describe(prefix_index.covered_by(network)) if is_cidr else [],
+        'children': describe(prefix_index.children(parent)) if parent is not None else [],
+        'network_type': classify_network_type(network)
+    })
+
+# Largest subnet (in host addresses) the allocator keeps a bitmap for (a /8)
+ALLOCATION_MAX_HOSTS = 1 << 24
+ALLOCATION_MAX_COUNT = 1024
+
+class SubnetBitmap:
+    """Occupancy bitmap over the host addresses of one subnet (bit set = used or reserved)"""
+
+    WORD_BITS = 64
+    FULL_WORD = (1 << 64) - 1
+
+    def __init__(self, network):
+        self.network = network
+        self.first, self.last = host_range(network)
+        self.size = max(self.last - self.first + 1, 0)
+        self.words = [0] * ((self.size + self.WORD_BITS - 1) // self.WORD_BITS)
+        self.taken = 0
+        self._lock = threading.Lock()
+        # Padding bits past the last host are permanently taken
+        spare = len(self.words) * self.WORD_BITS - self.size
+        if spare:
+            self.words[-1] = self.FULL_WORD ^ ((1 << (self.WORD_BITS - spare)) - 1)
+
+    def __contains__(self, address):
+        return self.first <= address <= self.last
+
+    def is_taken(self, address):
+        offset = address - self.first
+        return bool(self.words[offset // self.WORD_BITS] >> (offset % self.WORD_BITS) & 1)
+
+    def mark(self, address, taken=True):
+        """Set or clear the bit for an address (ignored if outside the host range)"""
+        if address not in self:
+            return
+        offset = address - self.first
+        index, bit = divmod(offset, self.WORD_BITS)
+        with self._lock:
+            was_taken = self.words[index] >> bit & 1
+            if taken and not was_taken:
+                self.words[index] |= 1 << bit
+                self.taken += 1
+            elif not taken and was_taken:
+                self.words[index] &= ~(1 << bit)
+                self.taken -= 1
+
+    def find_free(self, count):
+        """First count free addresses in address order (fewer if the subnet is short)"""
+        found = []
+        for index, word in enumerate(self.words):
+            if word == self.FULL_WORD:
+                continue
+            free_bits = ~word & self.FULL_WORD
+            while free_bits:
+                lowest = free_bits & -free_bits
+                found.append(self.first + index * self.WORD_BITS + lowest.bit_length() - 1)
+                if len(found) == count:
+                    return found
+                free_bits ^= lowest
+        return found
+
+    def find_free_run(self, count):
+        """Start of the first run of count consecutive free addresses, or None"""
+        run_start = 0
+        run_length = 0
+        for index, word in enumerate(self.words):
+            base = index * self.WORD_BITS
+            if word == self.FULL_WORD:
+                run_length = 0
+                continue
+            if word == 0:
+                if run_length == 0:
+                    run_start = base
+                run_length += self.WORD_BITS
+                if run_length >= count:
+                    return self.first + run_start
+                continue
+            for bit in range(self.WORD_BITS):
+                if word >> bit & 1:
+                    run_length = 0
+                    continue
+                if run_length == 0:
+                    run_start = base + bit
+                run_length += 1
+                if run_length >= count:
+                    return self.first + run_start
+        return None
+
+_allocation_bitmaps = {}  # network -> SubnetBitmap
+_allocation_locks = {}  # network -> Lock serializing allocations in that subnet
+_allocation_registry_lock = threading.Lock()
+
+def get_allocation_lock(network):
+    with _allocation_registry_lock:
+        return _allocation_locks.setdefault(network, threading.Lock())
+
+def get_allocation_bitmap(network, cursor):
+    """Bitmap for a subnet, built from ip_inventory on first use"""
+    bitmap = _allocation_bitmaps.get(network)
+    if bitmap is not None:
+        return bitmap
+    
+    bitmap = SubnetBitmap(network)
+    cursor.execute("""
+        SELECT ip_int FROM ip_inventory
+        WHERE status IN ('used', 'reserved') AND ip_int BETWEEN %s AND %s
+    """, (bitmap.first, bitmap.last))
+    for row in cursor.fetchall():
+        bitmap.mark(int(row['ip_int']))
+    
+    with _allocation_registry_lock:
+        _allocation_bitmaps[network] = bitmap
+    return bitmap
+
+def _update_allocation_bitmaps(old_row, new_row):
+    """Keep loaded bitmaps in step with a committed ip_inventory change"""
+    if not _allocation_bitmaps:
+        return
+    with _allocation_registry_lock:
+        bitmaps = list(_allocation_bitmaps.values())
+    for row, taken in ((old_row, False), (new_row, True)):
+        if not row or row.get('ip_int') is None:
+            continue
+        address = int(row['ip_int'])
+        for bitmap in bitmaps:
+            if address in bitmap:
+                bitmap.mark(address, taken and row['status'] in ('used', 'reserved'))
+
+def drop_allocation_bitmaps():
+    """Forget all bitmaps (rebuilt lazily) after bulk changes made elsewhere"""
+    with _allocation_registry_lock:
+        _allocation_bitmaps.clear()
+
+@app.route('/api/allocate', methods=['POST'])
+def api_allocate():
+    """API: Allocate the first free IP(s) in a subnet
+    
+    Body: subnet, count (default 1), contiguous (one run of count addresses),
+    status (used/reserved), vrf_vpn, hostname, description.
+    Allocations in a subnet are serialized and the candidate rows are locked in
+    MySQL, so concurrent callers never receive the same address.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            network = ipaddress.ip_network(data.get('subnet', ''), strict=False)
+        except ValueError:
+            return jsonify({'error': 'Invalid subnet format'}), 400
+        
+        count = data.get('count', 1)
+        if not isinstance(count, int) or not 1 <= count <= ALLOCATION_MAX_COUNT:
+            return jsonify({'error': f'count must be between 1 and {ALLOCATION_MAX_COUNT}'}), 400
+        status = data.get('status', 'used')
+        if status not in ('used', 'reserved'):
+            return jsonify({'error': 'status must be used or reserved'}), 400
+        contiguous = bool(data.get('contiguous', False))
+        
+        first_host, last_host = host_range(network)
+        if last_host - first_host + 1 > ALLOCATION_MAX_HOSTS:
+            return jsonify({'error': 'Subnet is too large to allocate from directly'}), 400
+        
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = connection.cursor(dictionary=True)
+        address_class = type(network.network_address)
+        subnet = str(network)
+        
+        with get_allocation_lock(network):
+            bitmap = get_allocation_bitmap(network, cursor)
+            connection.commit()
+            
+            # Another process may have taken a candidate since the bitmap was built;
+            # mark it and pick again
+            for attempt in range(5):
+                if contiguous:
+                    start = bitmap.find_free_run(count)
+                    candidates = list(range(start, start + count)) if start is not None else []
+                else:
+                    candidates = bitmap.find_free(count)
+                
+                if len(candidates) < count:
+                    cursor.close()
+                    connection.close()
+                    wanted = f'a contiguous run of {count}' if contiguous else str(count)
+                    return jsonify({'error': f'Not enough free addresses in {subnet} for {wanted}'}), 409
+                
+                placeholders = ', '.join(['%s'] * len(candidates))
+                cursor.execute(f"""
+                    SELECT id, {', '.join(IP_ROW_FIELDS)} FROM ip_inventory
+                    WHERE ip_int IN ({placeholders})
+                    FOR UPDATE
+                """, candidates)
+                existing = {int(row['ip_int']): row for row in cursor.fetchall()}
+                conflicts = [address for address, row in existing.items() if row['status'] in ('used', 'reserved')]
+                if not conflicts:
+                    break
+                
+                connection.rollback()
+                for address in conflicts:
+                    bitmap.mark(address)
+            else:
+                cursor.close()
+                connection.close()
+                return jsonify({'error': 'Allocation conflicted repeatedly, try again'}), 409
+            
+            changes = []
+            prefix_index = get_prefix_index()
+            for address in candidates:
+                ip_str = str(address_class(address))
+                old_row = existing.get(address)
+                if old_row:
+                    # Keep the row in its recorded subnet and keep fields the caller did not send
+                    row_subnet = old_row['subnet']
+                    defaults = old_row
+                else:
+                    # File a new address under the most specific known subnet, so counters
+                    # don't gain a key overlapping the existing ones
+                    match = prefix_index.longest_match(ip_str)
+                    row_subnet = str(match[0]) if match else subnet
+                    defaults = {}
+                new_row = {
+                    'ip_address': ip_str,
+                    'subnet': row_subnet,
+                    'status': status,
+                    'vrf_vpn': data.get('vrf_vpn', defaults.get('vrf_vpn') or ''),
+                    'hostname': data.get('hostname', defaults.get('hostname') or ''),
+                    'description': data.get('description', defaults.get('description') or ''),
+                    'ip_int': address
+                }
+                if old_row:
+                    # Address was recorded as available - claim it
+                    cursor.execute(f"""
+                        UPDATE ip_inventory SET {', '.join(f'{field} = %s' for field in IP_ROW_FIELDS)}, content_hash = NULL
+                        WHERE id = %s
+                    """, tuple(new_row[field] for field in IP_ROW_FIELDS) + (old_row['id'],))
+                    new_row['id'] = old_row['id']
+                else:
+                    cursor.execute(f"""
+                        INSERT INTO ip_inventory ({', '.join(IP_ROW_FIELDS)})
+                        VALUES ({', '.join(['%s'] * len(IP_ROW_FIELDS))})
+                    """, tuple(new_row[field] for field in IP_ROW_FIELDS))
+                    new_row['id'] = cursor.lastrowid
+                record_ip_change(cursor, old_row, new_row)
+                changes.append((old_row, new_row))
+            
+            connection.commit()
+            for old_row, new_row in changes:
+                publish_ip_change(old_row, new_row)
+        
+        cursor.close()
+        connection.close()
+        
+        return jsonify({
+            'success': True,
+            'subnet': subnet,
+            'count': len(candidates),
+            'allocated': [new_row['ip_address'] for _, new_row in changes],
+            'free_remaining': bitmap.size - bitmap.taken
+        })
+        
+    except IntegrityError:
+        # Lost a race with a writer outside this process - rebuild bitmaps from the database
+        drop_allocation_bitmaps()
+        return jsonify({'error': 'Allocation conflicted with a concurrent write, try again'}), 409
+    except Error as e:
+        print(f"❌ Error allocating IPs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Gaps probed per query when looking for IPs outside known subnets
+FREE_BLOCK_GAP_BATCH = 500
+
+def aligned_blocks(start, end, max_bits, max_prefixlen=None):
+    """Split an integer address range into maximal CIDR-aligned blocks as (start, prefixlen)
+    
+    With max_prefixlen, blocks smaller than that prefix length are left out.
+    """
+    if max_prefixlen is None:
+        max_prefixlen = max_bits
+    min_size = 1 << (max_bits - max_prefixlen)
+    blocks = []
+    while end - start + 1 >= min_size:
+        # Largest power-of-two block aligned at start that still fits
+        size = 1 << ((end - start + 1).bit_length() - 1)
+        if start:
+            size = min(size, start & -start)
+        if size >= min_size:
+            blocks.append((start, max_bits - size.bit_length() + 1))
+        start += size
+    return blocks
+
+def merge_intervals(intervals):
+    """Coalesce overlapping or adjacent [start, end] integer intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def complement_intervals(first, last, merged):
+    """Free [start, end] ranges within first..last around sorted, merged occupied intervals"""
+    free = []
+    next_free = first
+    for start, end in merged:
+        if start > next_free:
+            free.append((next_free, min(start - 1, last)))
+        next_free = max(next_free, end + 1)
+        if next_free > last:
+            break
+    if next_free <= last:
+        free.append((next_free, last))
+    return free
+
+def find_free_ranges(cursor, parent):
+    """Free [start, end] address ranges under a parent prefix, in address order
+    
+    Occupied space is every known subnet and reserved block strictly inside the
+    parent plus any recorded IP outside those. Only the gaps between subnets are
+    probed for stray IPs, so cost follows the number of subnets, not addresses.
+    """
+    parent_start = int(parent.network_address)
+    parent_end = int(parent.broadcast_address)
+    
+    occupied = [
+        (int(net.network_address), int(net.broadcast_address))
+        for net, _ in get_prefix_index().covered_by(parent) if net != parent
+    ]
+    
+    cursor.execute("""
+        SELECT subnet FROM subnets
+        WHERE status = 'active' AND range_start <= %s AND range_end >= %s
+    """, (parent_end, parent_start))
+    for row in cursor.fetchall():
+        try:
+            network = ipaddress.ip_network(row['subnet'], strict=False)
+        except ValueError:
+            continue
+        if network.version == parent.version and network != parent and network.subnet_of(parent):
+            occupied.append((int(network.network_address), int(network.broadcast_address)))
+    
+    # Space between the occupied subnets
+    gaps = complement_intervals(parent_start, parent_end, merge_intervals(occupied))
+    
+    # Recorded IPs that are not inside any known subnet
+    for i in range(0, len(gaps), FREE_BLOCK_GAP_BATCH):
+        batch = gaps[i:i + FREE_BLOCK_GAP_BATCH]
+        conditions = " OR ".join(["ip_int BETWEEN %s AND %s"] * len(batch))
+        cursor.execute(
+            f"SELECT ip_int FROM ip_inventory WHERE {conditions}",
+            [bound for gap in batch for bound in gap]
+        )
+        occupied.extend((int(row['ip_int']),) * 2 for row in cursor.fetchall())
+    
+    # One sweep over subnets and stray IPs together
+    return complement_intervals(parent_start, parent_end, merge_intervals(occupied))
+
+def find_free_blocks(cursor, parent, max_prefixlen=None):
+    """Free CIDR-aligned blocks under a parent prefix as (start, prefixlen), in address order
+    
+    Ranges too short to hold a block of max_prefixlen are skipped without being split.
+    """
+    blocks = []
+    for start, end in find_free_ranges(cursor, parent):
+        blocks.extend(aligned_blocks(start, end, parent.max_prefixlen, max_prefixlen))
+    return blocks
+
+@app.route('/api/prefix/free-blocks')
+def api_prefix_free_blocks():
+    """API: Largest free aligned blocks under a parent prefix
+    
+    Optional prefixlen only lists blocks big enough to hold a child of that length.
+    """
+    try:
+        try:
+            parent = ipaddress.ip_network(request.args.get('parent', '').strip(), strict=False)
+        except ValueError:
+            return jsonify({'error': 'Invalid parent prefix'}), 400
+        prefixlen = request.args.get('prefixlen', parent.max_prefixlen, type=int)
+        if not parent.prefixlen <= prefixlen <= parent.max_prefixlen:
+            return jsonify({'error': f'prefixlen must be between {parent.prefixlen} and {parent.max_prefixlen}'}), 400
+        limit = request.args.get('limit', 50, type=int)
+        if limit < 0:
+            return jsonify({'error': 'limit must not be negative'}), 400
+        
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = connection.cursor(dictionary=True)
+        free_ranges = find_free_ranges(cursor, parent)
+        cursor.close()
+        connection.close()
+        
+        blocks = []
+        for start, end in free_ranges:
+            blocks.extend(aligned_blocks(start, end, parent.max_prefixlen, prefixlen))
+        
+        address_class = type(parent.network_address)
+        by_prefixlen = {}
+        for _, length in blocks:
+            by_prefixlen[length] = by_prefixlen.get(length, 0) + 1
+        
+        # Largest blocks first, lowest address first within a size
+        fitting = sorted(blocks, key=lambda block: (block[1], block[0]))
+        
+        return jsonify({
+            'parent': str(parent),
+            'free_addresses': sum(end - start + 1 for start, end in free_ranges),
+            'largest_free_prefixlen': min(by_prefixlen) if by_prefixlen else None,
+            'blocks_by_prefixlen': {f'/{length}': count for length, count in sorted(by_prefixlen.items())},
+            'blocks': [
+                {'prefix': f'{address_class(start)}/{length}', 'size': 1 << (parent.max_prefixlen - length)}
+                for start, length in fitting[:limit]
+            ],
+            'total_blocks': len(fitting)
+        })
+        
+    except Error as e:
+        print(f"❌ Error finding free blocks: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/prefix/reserve', methods=['POST'])
+def api_prefix_reserve():
+    """API: Atomically reserve a free child prefix of the requested length
+    
+    Body: parent, prefixlen, description, service_domain. Buddy-style best fit:
+    the child is carved from the start of the smallest free block that can hold it.
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            parent = ipaddress.ip_network(data.get('parent', ''), strict=False)
+        except ValueError:
+            return jsonify({'error': 'Invalid parent prefix'}), 400
+        prefixlen = data.get('prefixlen')
+        if not isinstance(prefixlen, int) or not parent.prefixlen <= prefixlen <= parent.max_prefixlen:
+            return jsonify({'error': f'prefixlen must be between {parent.prefixlen} and {parent.max_prefixlen}'}), 400
+        
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = connection.cursor(dictionary=True)
+        
+        # Named lock serializes reservations across threads and server processes
+        cursor.execute("SELECT GET_LOCK('ipam_prefix_reserve', 10) as locked")
+        if not cursor.fetchone()['locked']:
+            cursor.close()
+            connection.close()
+            return jsonify({'error': 'Another reservation is in progress, try again'}), 409
+        
+        try:
+            blocks = find_free_blocks(cursor, parent, prefixlen)
+            if not blocks:
+                return jsonify({'error': f'No free /{prefixlen} left in {parent}'}), 409
+            
+            start, _ = max(blocks, key=lambda block: (block[1], -block[0]))
+            child = type(parent)((start, prefixlen))
+            
+            cursor.execute("""
+                INSERT INTO subnets (subnet, description, service_domain, status, range_start, range_end)
+                VALUES (%s, %s, %s, 'active', %s, %s)
+            """, (
+                str(child),
+                data.get('description', ''),
+                data.get('service_domain', ''),
+                int(child.network_address),
+                int(child.broadcast_address)
+            ))
+            connection.commit()
+            new_id = cursor.lastrowid
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('ipam_prefix_reserve')")
+            cursor.fetchall()
+            cursor.close()
+            connection.close()
+        
+        bump_data_generation()
+        
+        return jsonify({'success': True, 'id': new_id, 'subnet': str(child), 'parent': str(parent)})
+        
+    except Error as e:
+        print(f"❌ Error reserving prefix: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/add-ip', methods=['POST'])
 def api_add_ip():
     """API to add new IP"""
@@ -955,8 +3209,8 @@ def api_add_ip():
         # Insert new IP
         insert_query = """
             INSERT INTO ip_inventory 
-            (ip_address, subnet, status, vrf_vpn, hostname, description)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            (ip_address, subnet, status, vrf_vpn, hostname, description, ip_int)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
         """
         
         values = (
@@ -965,17 +3219,22 @@ def api_add_ip():
             data['status'],
             data.get('vrf_vpn', ''),
             data.get('hostname', ''),
-            data.get('description', '')
+            data.get('description', ''),
+            ip_to_int(data['ip_address'])
         )
         
         cursor.execute(insert_query, values)
+        new_row = dict(zip(IP_ROW_FIELDS, values))
+        new_row['id'] = cursor.lastrowid
+        record_ip_change(cursor, None, new_row)
         connection.commit()
+        publish_ip_change(None, new_row)
         
-        new_id = cursor.lastrowid
         cursor.close()
         connection.close()
         
-        return jsonify({'success': True, 'id': new_id, 'message': 'IP added successfully'})
+        # cursor.lastrowid now belongs to the change log statements - use the id captured after the INSERT
+        return jsonify({'success': True, 'id': new_row['id'], 'message': 'IP added successfully'})
         
     except Error as e:
         print(f"❌ Error adding IP: {e}")
@@ -991,11 +3250,12 @@ def api_update_ip(ip_id):
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
             
-        cursor = connection.cursor()
+        cursor = connection.cursor(dictionary=True)
         
-        # Check if IP exists
-        cursor.execute("SELECT id FROM ip_inventory WHERE id = %s", (ip_id,))
-        if not cursor.fetchone():
+        # Check if IP exists (and lock the row so derived counters stay consistent)
+        cursor.execute(f"SELECT id, {', '.join(IP_ROW_FIELDS)} FROM ip_inventory WHERE id = %s FOR UPDATE", (ip_id,))
+        old_row = cursor.fetchone()
+        if not old_row:
             cursor.close()
             connection.close()
             return jsonify({'error': 'IP not found'}), 404
@@ -1023,6 +3283,8 @@ def api_update_ip(ip_id):
                 cursor.close()
                 connection.close()
                 return jsonify({'error': 'Invalid IP address format'}), 400
+            update_fields.append("ip_int = %s")
+            values.append(ip_to_int(data['ip_address']))
         
         # Validate subnet if provided
         if 'subnet' in data:
@@ -1033,11 +3295,23 @@ def api_update_ip(ip_id):
                 connection.close()
                 return jsonify({'error': 'Invalid subnet format'}), 400
         
+        new_row = dict(old_row)
+        for field in updatable_fields:
+            if field in data:
+                new_row[field] = data[field]
+        if 'ip_address' in data:
+            new_row['ip_int'] = ip_to_int(data['ip_address'])
+        
+        # A manual edit takes the row out of the CSV importer's delta mode
+        update_fields.append("content_hash = NULL")
+        
         values.append(ip_id)
         update_query = f"UPDATE ip_inventory SET {', '.join(update_fields)} WHERE id = %s"
         
         cursor.execute(update_query, values)
+        record_ip_change(cursor, old_row, new_row)
         connection.commit()
+        publish_ip_change(old_row, new_row)
         
         cursor.close()
         connection.close()
@@ -1056,18 +3330,21 @@ def api_delete_ip(ip_id):
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
             
-        cursor = connection.cursor()
+        cursor = connection.cursor(dictionary=True)
         
         # Check if IP exists
-        cursor.execute("SELECT id FROM ip_inventory WHERE id = %s", (ip_id,))
-        if not cursor.fetchone():
+        cursor.execute(f"SELECT id, {', '.join(IP_ROW_FIELDS)} FROM ip_inventory WHERE id = %s FOR UPDATE", (ip_id,))
+        old_row = cursor.fetchone()
+        if not old_row:
             cursor.close()
             connection.close()
             return jsonify({'error': 'IP not found'}), 404
         
         # Delete IP
         cursor.execute("DELETE FROM ip_inventory WHERE id = %s", (ip_id,))
+        record_ip_change(cursor, old_row, None)
         connection.commit()
+        publish_ip_change(old_row, None)
         
         cursor.close()
         connection.close()
@@ -1079,12 +3356,23 @@ def api_delete_ip(ip_id):
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    if '--rebuild-counters' in sys.argv:
+        # Maintenance: repair ip_subnet_counters drift and exit
+        rebuild_subnet_counters()
+        sys.exit(0)
+    if '--compact-changes' in sys.argv:
+        # Maintenance: apply the change log retention policy and exit
+        compact_change_log()
+        sys.exit(0)
+    
     print("\n" + "="*60)
     print("🚀 Starting IPAM System - Clean Version")
     print("="*60)
     
     # Initialize database
     init_database()
+    load_prefix_index()
+    start_generation_poller()
     
     print("\n🌐 Server URLs:")
     print("   Main (IP Management): http://127.0.0.1:5005")
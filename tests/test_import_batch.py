@@ -0,0 +1,33 @@
+"""
+write_batch keeps ip_subnet_counters in step with every committed batch
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_csv_data as importer
+from test_import_delta import FakeConnection, FakeCursor, csv_values
+
+
+def test_write_batch_applies_counter_deltas_per_batch():
+    cursor = FakeCursor({})
+    connection = FakeConnection()
+
+    first = [csv_values('10.0.0.1'), csv_values('10.0.0.2'), csv_values('10.0.1.1')]
+    assert importer.write_batch(connection, cursor, first) == (3, 0)
+    assert connection.commits == 1
+    assert cursor.counters == {
+        ('10.0.0.0/24', 'production', 'used'): 2,
+        ('10.0.1.0/24', 'production', 'used'): 1,
+    }
+
+    # A later batch repeating an address moves it between counters instead of adding it twice
+    second = [csv_values('10.0.0.2', status_up=False), csv_values('10.0.0.3'), csv_values('10.0.0.3', status_up=False)]
+    assert importer.write_batch(connection, cursor, second) == (3, 0)
+    assert cursor.counters == {
+        ('10.0.0.0/24', 'production', 'used'): 1,
+        ('10.0.0.0/24', 'production', 'reserved'): 2,
+        ('10.0.1.0/24', 'production', 'used'): 1,
+    }
@@ -0,0 +1,131 @@
+"""
+apply_delta_batch against an in-memory fake cursor (no MySQL needed)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_csv_data as importer
+
+
+class FakeCursor:
+    """Understands just the statements apply_delta_batch issues"""
+
+    def __init__(self, rows):
+        self.rows = rows  # ip_int -> row dict (DELTA_ROW_FIELDS)
+        self.counters = {}
+        self.change_log = []
+        self.seq = 0
+        self.lastrowid = None
+        self._result = []
+        self._next_id = 100
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        params = list(params)
+        if sql.startswith('SELECT'):
+            self._result = [
+                tuple(self.rows[ip_int][field] for field in importer.DELTA_ROW_FIELDS)
+                for ip_int in params if ip_int in self.rows
+            ]
+        elif sql.startswith('INSERT INTO ip_inventory'):
+            width = len(importer.IMPORT_COLUMNS)
+            for start in range(0, len(params), width):
+                values = dict(zip(importer.IMPORT_COLUMNS, params[start:start + width]))
+                row = self.rows.get(values['ip_int'])
+                if row is None:
+                    row = self.rows[values['ip_int']] = {'id': self._next_id}
+                    self._next_id += 1
+                row.update(values)
+        elif sql.startswith('DELETE FROM ip_inventory'):
+            for ip_int in params:
+                self.rows.pop(ip_int, None)
+        elif sql.startswith('INSERT INTO ip_subnet_counters'):
+            for start in range(0, len(params), 4):
+                subnet, vrf_vpn, status, delta = params[start:start + 4]
+                key = (subnet, vrf_vpn, status)
+                self.counters[key] = self.counters.get(key, 0) + delta
+        elif sql.startswith('DELETE FROM ip_subnet_counters'):
+            self.counters = {key: count for key, count in self.counters.items() if count > 0}
+        elif sql.startswith('INSERT INTO ipam_meta'):
+            self.seq += params[1]
+            self.lastrowid = self.seq
+        elif sql.startswith('INSERT INTO ip_change_log'):
+            for start in range(0, len(params), 5):
+                self.change_log.append(tuple(params[start:start + 5]))
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def fetchall(self):
+        return self._result
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        raise AssertionError("unexpected rollback")
+
+
+def csv_values(ip_address, hostname='node-1', status_up=True):
+    return importer.normalize_csv_row({
+        'ifIP': ip_address, 'host_name': hostname, 'domain': 'PROD',
+        'ifAdminStatus': 'Up', 'ifOperStatus': 'Up' if status_up else 'Down'
+    })
+
+
+def stored_row(values, row_id, content_hash=None):
+    """ip_inventory row for normalized values (content_hash None = manually managed)"""
+    row = dict(zip(importer.IMPORT_COLUMNS, values), id=row_id)
+    row['content_hash'] = content_hash
+    return row
+
+
+def test_apply_delta_batch_counts_inserts_updates_deletes():
+    old = csv_values('10.0.0.2', hostname='old-name')
+    gone = csv_values('10.0.0.3')
+    rows = {
+        old[6]: stored_row(old, 1, content_hash=old[7]),
+        gone[6]: stored_row(gone, 2, content_hash=gone[7]),
+    }
+    cursor = FakeCursor(rows)
+    cursor.counters = {('10.0.0.0/24', 'production', 'used'): 2}
+    connection = FakeConnection()
+
+    new = csv_values('10.0.0.1')
+    changed = csv_values('10.0.0.2', hostname='new-name', status_up=False)
+    result = importer.apply_delta_batch(connection, cursor, [new, changed], [gone[6]])
+
+    assert result == {'inserted': 1, 'updated': 1, 'deleted': 1, 'kept_manual': 0}
+    assert connection.commits == 1
+    assert [entry[1] for entry in cursor.change_log] == ['insert', 'update', 'delete']
+    assert [entry[0] for entry in cursor.change_log] == [1, 2, 3]
+    assert rows[changed[6]]['hostname'] == 'new-name'
+    assert gone[6] not in rows
+    assert cursor.counters == {
+        ('10.0.0.0/24', 'production', 'used'): 1,
+        ('10.0.0.0/24', 'production', 'reserved'): 1,
+    }
+
+
+def test_apply_delta_batch_keeps_rows_edited_since_fingerprints_loaded():
+    edited = csv_values('10.0.0.5', hostname='edited-in-ui')
+    manual = csv_values('10.0.0.6')
+    rows = {
+        edited[6]: stored_row(edited, 1),
+        manual[6]: stored_row(manual, 2),
+    }
+    cursor = FakeCursor(rows)
+
+    result = importer.apply_delta_batch(FakeConnection(), cursor, [csv_values('10.0.0.5')], [manual[6]])
+
+    assert result == {'inserted': 0, 'updated': 0, 'deleted': 0, 'kept_manual': 2}
+    assert rows[edited[6]]['hostname'] == 'edited-in-ui'
+    assert manual[6] in rows
+    assert cursor.change_log == []
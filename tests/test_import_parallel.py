@@ -0,0 +1,46 @@
+"""
+Parallel chunked parsing must yield the same rows and offsets as the serial reader
+"""
+
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_csv_data as importer
+
+
+def write_csv(path, rows, multiline_every=None):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(('ifIP', 'host_name', 'ifDescr', 'domain', 'ifAdminStatus', 'ifOperStatus'))
+        for i in range(rows):
+            descr = f"uplink {i}\nsecond line" if multiline_every and i % multiline_every == 0 else f"uplink {i}"
+            writer.writerow((f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", f"node-{i}", descr, 'PROD', 'Up', 'Up'))
+            if i % 500 == 0:
+                file.write('\r\n')  # blank line - produces no record
+
+
+def read_all(path, workers, monkeypatch):
+    # Small chunks so a few thousand rows span many workers' ranges
+    monkeypatch.setattr(importer.csv_chunks, '__defaults__', (2048, 0))
+    counts = {'processed': 0, 'skipped': 0}
+    rows = []
+    for values in importer.normalized_rows(path, None, counts, workers):
+        rows.append((values, counts['offset']))
+    return rows
+
+
+def test_parallel_matches_serial_for_single_line_records(tmp_path, monkeypatch):
+    path = str(tmp_path / 'plain.csv')
+    write_csv(path, 3000)
+    assert read_all(path, 3, monkeypatch) == read_all(path, 1, monkeypatch)
+
+
+def test_parallel_falls_back_to_serial_on_multiline_records(tmp_path, monkeypatch):
+    path = str(tmp_path / 'multiline.csv')
+    write_csv(path, 3000, multiline_every=1200)
+    serial = read_all(path, 1, monkeypatch)
+    assert sum('second line' in values[5] for values, _ in serial) == 3
+    assert read_all(path, 3, monkeypatch) == serial
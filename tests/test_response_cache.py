@@ -0,0 +1,53 @@
+"""
+cached_json keeps serving the previous generation's body while one refresh runs
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+
+import main_server
+
+calls = []
+release = threading.Event()
+
+
+def slow_view():
+    """Returns the generation it ran under; blocks once the first body is cached"""
+    if calls:
+        release.wait(5)
+    calls.append(main_server.current_data_generation())
+    return jsonify({'generation': calls[-1]})
+
+
+main_server.app.add_url_rule('/api/test-swr', 'test_swr', main_server.cached_json(slow_view))
+
+
+def test_previous_generation_served_until_a_reload_asks_for_the_new_one():
+    client = main_server.app.test_client()
+    first = client.get('/api/test-swr')
+    old_body, old_etag = first.get_json(), first.headers['ETag']
+
+    generation = main_server.bump_data_generation()
+
+    # Plain poll: previous body right away, tagged with its own generation
+    polled = client.get('/api/test-swr')
+    assert polled.get_json() == old_body
+    assert polled.headers['ETag'] == old_etag
+    assert main_server._response_flight.in_flight(('test_swr', ()))
+
+    # A reload after the change event joins the running refresh
+    release.set()
+    reloaded = client.get('/api/test-swr', headers={main_server.GENERATION_HEADER: str(generation)})
+    assert reloaded.get_json() == {'generation': generation}
+    assert len(calls) == 2
+
+    # A conditional request holding the old body gets the new one, not a 304
+    conditional = client.get('/api/test-swr', headers={'If-None-Match': old_etag})
+    assert conditional.status_code == 200
+    assert conditional.get_json() == {'generation': generation}
+    assert len(calls) == 2